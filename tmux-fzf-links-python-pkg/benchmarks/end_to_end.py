@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Run the plugin end to end on synthetic or recorded pane captures and report
+# the wall time of each stage and the peak memory.
+#
+# The plugin runs against the stub `tmux` and `fzf` commands of stubs.py, so
+# that no tmux server and no user are needed. Every run is a fresh process
+# started in the same way as by the key binding, with tracing enabled; the
+# stages are taken from the JSON trace that the plugin writes to its log file.
+#
+# Usage: python3 benchmarks/end_to_end.py [--sizes 1000,10000,100000,1000000]
+#            [--capture FILE] [--runs N] [--save FILE] [--compare FILE]
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+from typing import Any
+
+from stubs import create_source_files, install_stubs, plugin_args, synthetic_capture, write_pane
+
+DEFAULT_SIZES = "1000,10000,100000"
+# Relative slowdown of a stage reported as a regression by --compare
+DEFAULT_TOLERANCE = 0.25
+# Stages shorter than this are too noisy to be compared
+MIN_COMPARED_MS = 5.0
+
+def run_once(python:str, args:list[str], env:dict[str,str], cwd:str) -> tuple[float,float]:
+    """Run the plugin in a new process and return its wall time in milliseconds and its peak memory in MB."""
+    start = time.perf_counter()
+    proc = subprocess.Popen([python, "-m", "tmux_fzf_links", *args],
+        env=env, cwd=cwd, stdin=subprocess.DEVNULL)
+    # Unlike `wait`, `wait4` reports the resources used by this very process
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args)
+    # ru_maxrss is in kilobytes on Linux
+    return (time.perf_counter() - start) * 1e3, usage.ru_maxrss / 1024
+
+def read_traces(log_filename:str) -> list[dict[str,Any]]:
+    """Return the JSON traces written by the plugin to its log file."""
+    traces:list[dict[str,Any]] = []
+    with open(log_filename) as f:
+        for line in f:
+            _, found, trace = line.partition(" - trace: ")
+            if found:
+                traces.append(json.loads(trace))
+    return traces
+
+def measure(capture:str, runs:int, scan_cache:bool, python:str, scan_processes:int=0, nearest_links:int=0) -> dict[str,Any]:
+    """Run the plugin `runs` times on the capture and return the median of each measurement."""
+    num_lines = capture.count('\n')
+    with tempfile.TemporaryDirectory() as work_dir:
+        env = install_stubs(work_dir)
+        write_pane(work_dir, capture, env)
+        pane_dir = os.path.join(work_dir, "pane")
+        create_source_files(pane_dir)
+        log_filename = os.path.join(work_dir, "log.txt")
+        args = plugin_args(num_lines, scan_cache, log_filename, trace=True, scan_processes=scan_processes, nearest_links=nearest_links)
+
+        results:list[dict[str,Any]] = []
+        for _ in range(runs):
+            for name in ("messages.txt", "choices.txt", "log.txt"):
+                try:
+                    os.unlink(os.path.join(work_dir, name))
+                except FileNotFoundError:
+                    pass
+
+            wall_time, peak_memory = run_once(python, args, env, pane_dir)
+            trace = read_traces(log_filename)[-1]
+            # Time spent outside `run()`, mostly starting the interpreter and importing the package
+            stages = {"startup and exit": wall_time - trace["total_ms"], **trace["stages"], "total": wall_time}
+            result:dict[str,Any] = {"stages": stages, "schemes": trace["schemes"], "peak_memory_mb": peak_memory}
+
+            with open(os.path.join(work_dir, "choices.txt")) as f:
+                num_choices, num_bytes = f.read().split()
+            result["choices"] = int(num_choices)
+            result["fzf_input_kb"] = int(num_bytes) / 1024
+            messages_path = os.path.join(work_dir, "messages.txt")
+            if os.path.exists(messages_path):
+                with open(messages_path) as f:
+                    result["messages"] = f.read().splitlines()
+            results.append(result)
+
+    stage_names = list(dict.fromkeys(name for result in results for name in result["stages"]))
+    return {
+        "lines": num_lines,
+        "choices": results[-1]["choices"],
+        "fzf_input_kb": results[-1]["fzf_input_kb"],
+        "messages": results[-1].get("messages", []),
+        "stages": {name: statistics.median(result["stages"].get(name, 0.0) for result in results) for name in stage_names},
+        "schemes": results[-1]["schemes"],
+        "peak_memory_mb": statistics.median(result["peak_memory_mb"] for result in results),
+    }
+
+def print_report(reports:list[dict[str,Any]]) -> None:
+    stage_names = list(dict.fromkeys(name for report in reports for name in report["stages"]))
+    print("median wall time per stage in ms; stages running in the background overlap with fzf")
+    for report in reports:
+        print(f"\n{report['lines']} lines, {report['choices']} choices ({report['fzf_input_kb']:.0f} kB sent to fzf), peak memory {report['peak_memory_mb']:.1f} MB")
+        for name in stage_names:
+            if name in report["stages"]:
+                print(f"  {name:<26} {report['stages'][name]:>10.1f}")
+        for tag, scheme in report["schemes"].items():
+            print(f"  scheme {tag:<19} regex {scheme['regex_ms']:>8.1f}  pre_handler {scheme['pre_handler_ms']:>8.1f}  matches {scheme['matches']:>7}")
+        for message in report["messages"]:
+            print(f"  tmux message: {message}")
+
+def compare(reports:list[dict[str,Any]], baseline:list[dict[str,Any]], tolerance:float) -> list[str]:
+    """Return the stages that became slower than in the baseline by more than `tolerance`."""
+    regressions:list[str] = []
+    baseline_by_lines = {report["lines"]: report for report in baseline}
+    for report in reports:
+        reference = baseline_by_lines.get(report["lines"])
+        if reference is None:
+            continue
+        for name, value in report["stages"].items():
+            reference_value = reference["stages"].get(name)
+            if reference_value is None or max(value, reference_value) < MIN_COMPARED_MS:
+                continue
+            if value > reference_value * (1 + tolerance):
+                regressions.append(f"{report['lines']} lines, {name}: {reference_value:.1f} ms -> {value:.1f} ms")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the plugin end to end against stub tmux and fzf.")
+    _ = parser.add_argument("--sizes", default=DEFAULT_SIZES,
+        help="comma-separated numbers of lines of the synthetic captures")
+    _ = parser.add_argument("--capture", action="append", default=[],
+        help="recorded pane capture to replay instead of the synthetic ones (may be repeated)")
+    _ = parser.add_argument("--runs", type=int, default=3)
+    _ = parser.add_argument("--seed", type=int, default=0)
+    _ = parser.add_argument("--scan-cache", action=argparse.BooleanOptionalAction, default=False,
+        help="keep the scan cache enabled, as in normal use")
+    _ = parser.add_argument("--scan-processes", type=int, default=0,
+        help="number of processes scanning the history")
+    _ = parser.add_argument("--nearest-links", type=int, default=0,
+        help="stop scanning the history once this many links are found")
+    _ = parser.add_argument("--save", help="write the results to a JSON file")
+    _ = parser.add_argument("--compare", help="fail if a stage is slower than in this JSON file")
+    _ = parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    _ = parser.add_argument("--python", default=sys.executable)
+    args = parser.parse_args()
+
+    captures:list[str] = []
+    for path in args.capture:
+        with open(path) as f:
+            captures.append(f.read())
+    if not captures:
+        captures = [synthetic_capture(int(size), args.seed) for size in args.sizes.split(',')]
+
+    reports = [measure(capture, args.runs, args.scan_cache, args.python, args.scan_processes, args.nearest_links) for capture in captures]
+    print_report(reports)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(reports, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(reports, json.load(f), args.tolerance)
+        if regressions:
+            print("regressions:", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
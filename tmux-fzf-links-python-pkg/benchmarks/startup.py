@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Measure the time from the key press, i.e. the start of the interpreter, to
+# the first call to tmux, which is when the capture of the pane begins.
+#
+# The plugin runs against the stub `tmux` and `fzf` commands of stubs.py:
+# tmux records the time of its first invocation in a marker file and fzf
+# exits without selecting anything.
+#
+# Usage: python3 benchmarks/startup.py [--runs N] [--budget-ms MS] [--pyz]
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+from stubs import PKG_DIR, install_stubs, plugin_args, write_pane
+
+SAMPLE_CONTENT = """\
+$ ls -l
+drwxr-xr-x  5 user staff  160 Jan  1 12:00 src
+-rw-r--r--  1 user staff 1024 Jan  1 12:00 README.md
+$ git log --oneline
+See https://github.com/alberti42/tmux-fzf-links for details
+Traceback: File "/usr/lib/python3/site.py", line 73, in <module>
+"""
+
+def measure(python:str, python_path:str, work_dir:str, runs:int) -> list[float]:
+    """Return the delays in milliseconds between the start of each run and its first call to tmux."""
+    marker = os.path.join(work_dir, "marker")
+    env = install_stubs(work_dir)
+    write_pane(work_dir, SAMPLE_CONTENT, env)
+    env["PYTHONPATH"] = python_path
+    # Nothing is selected in fzf
+    env["FZF_LINKS_BENCH_PICK"] = "0"
+
+    delays:list[float] = []
+    for _ in range(runs):
+        try:
+            os.unlink(marker)
+        except FileNotFoundError:
+            pass
+        start_ns = time.time_ns()
+        _ = subprocess.run([python, "-m", "tmux_fzf_links", *plugin_args()],
+            env=env, cwd=work_dir, check=True, stdin=subprocess.DEVNULL)
+        delays.append((os.stat(marker).st_mtime_ns - start_ns) / 1e6)
+    return delays
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure the startup latency of the plugin.")
+    _ = parser.add_argument("--runs", type=int, default=20)
+    _ = parser.add_argument("--budget-ms", type=float, default=0.0,
+        help="fail when the median latency exceeds this budget")
+    _ = parser.add_argument("--pyz", action="store_true",
+        help="run from the archive built by build_zipapp.py")
+    _ = parser.add_argument("--python", default=sys.executable)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        python_path = PKG_DIR
+        if args.pyz:
+            pyz_file = os.path.join(work_dir, "tmux_fzf_links.pyz")
+            _ = subprocess.run([args.python, os.path.join(PKG_DIR, "build_zipapp.py"), pyz_file],
+                check=True, stdout=subprocess.DEVNULL)
+            python_path = pyz_file
+        else:
+            # Warm up the bytecode cache as in normal use
+            _ = subprocess.run([args.python, "-m", "compileall", "-q", os.path.join(PKG_DIR, "tmux_fzf_links")], check=True)
+
+        delays = measure(args.python, python_path, work_dir, args.runs)
+
+    median = statistics.median(delays)
+    print(f"time to first tmux call: median {median:.1f} ms, min {min(delays):.1f} ms, max {max(delays):.1f} ms ({len(delays)} runs)")
+
+    if args.budget_ms and median > args.budget_ms:
+        print(f"over budget: {median:.1f} ms > {args.budget_ms:.1f} ms", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
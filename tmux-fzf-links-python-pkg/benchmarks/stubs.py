@@ -0,0 +1,153 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Stand-ins for `tmux` and `fzf` shared by the benchmarks, together with a
+# generator of synthetic pane captures.
+#
+# The stub tmux serves the pane from two files in the work directory: the
+# visible screen (screen.txt) and the history (history.txt). It records the
+# messages displayed by the plugin in messages.txt and runs the popup command
+# directly. The stub fzf selects the choice given by FZF_LINKS_BENCH_PICK
+# without user input and records the number of choices it received and their
+# size in bytes.
+
+import os
+import random
+
+PKG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Size of the fake pane
+PANE_HEIGHT = 50
+PANE_WIDTH = 200
+HISTORY_LIMIT = 2000000
+
+STUB_TMUX = """#!/bin/sh
+[ -e "$FZF_LINKS_BENCH_DIR/marker" ] || : > "$FZF_LINKS_BENCH_DIR/marker"
+case "$1" in
+  capture-pane)
+    start=""
+    end="-1"
+    prev=""
+    for arg in "$@"; do
+      [ "$prev" = "-S" ] && start="$arg"
+      [ "$prev" = "-E" ] && end="$arg"
+      prev="$arg"
+    done
+    if [ -n "$start" ]; then
+      tail -n "${start#-}" "$FZF_LINKS_BENCH_DIR/history.txt" | head -n $((${start#-} - ${end#-} + 1))
+    else
+      cat "$FZF_LINKS_BENCH_DIR/screen.txt"
+    fi ;;
+  display|display-message)
+    case "$*" in
+      *pane_current_path*)
+        # Variables of the pane, possibly followed by the screen (see tmux.PANE_VARIABLES)
+        printf '%%0\\t%s\\t%s\\t%s\\t%s\\t%s\\n' "$FZF_LINKS_BENCH_PANE_HEIGHT" "$FZF_LINKS_BENCH_PANE_WIDTH" \\
+          "$FZF_LINKS_BENCH_HISTORY_SIZE" "$FZF_LINKS_BENCH_HISTORY_LIMIT" "$PWD"
+        case "$*" in *capture-pane*) cat "$FZF_LINKS_BENCH_DIR/screen.txt" ;; esac ;;
+      *)
+        shift $(($# - 1))
+        printf '%s\\n' "$1" >> "$FZF_LINKS_BENCH_DIR/messages.txt" ;;
+    esac ;;
+  popup|display-popup) shift $(($# - 1)); sh -c "$1" ;;
+esac
+exit 0
+"""
+
+STUB_FZF = """#!/bin/sh
+LC_ALL=C awk -v pick="${FZF_LINKS_BENCH_PICK:-1}" -v count="$FZF_LINKS_BENCH_DIR/choices.txt" '
+  { bytes += length($0) + 1; gsub(/\\033\\[[0-9;]*m/, "") }
+  NR == pick { selected = $0 }
+  END { print NR > count; print bytes > count; if (selected == "") exit 1; print selected }'
+"""
+
+# Files referred to by the synthetic captures, so that the pre-handlers find some of the paths
+NUM_SOURCE_FILES = 50
+
+def write_executable(path:str, text:str) -> None:
+    with open(path, "w") as f:
+        _ = f.write(text)
+    os.chmod(path, 0o755)
+
+def install_stubs(work_dir:str) -> dict[str,str]:
+    """Write the stubs to `work_dir` and return the environment to run the plugin against them."""
+    write_executable(os.path.join(work_dir, "tmux"), STUB_TMUX)
+    write_executable(os.path.join(work_dir, "fzf"), STUB_FZF)
+
+    env = dict(os.environ)
+    env.update({
+        "PATH": f"{work_dir}:{env.get('PATH', '')}",
+        "PYTHONPATH": PKG_DIR,
+        "TMUX": f"{work_dir}/tmux-socket,0,0",
+        "TMUX_PANE": "%0",
+        # Keep the caches and statistics of the plugin apart from those of the user
+        "TMUX_TMPDIR": work_dir,
+        "FZF_LINKS_BENCH_DIR": work_dir,
+        "FZF_LINKS_BENCH_PANE_HEIGHT": str(PANE_HEIGHT),
+        "FZF_LINKS_BENCH_PANE_WIDTH": str(PANE_WIDTH),
+        "FZF_LINKS_BENCH_HISTORY_SIZE": "0",
+        "FZF_LINKS_BENCH_HISTORY_LIMIT": str(HISTORY_LIMIT),
+    })
+    return env
+
+def write_pane(work_dir:str, capture:str, env:dict[str,str]) -> None:
+    """Split a capture into the history and the visible screen served by the stub tmux."""
+    lines = capture.splitlines(keepends=True)
+    split = max(len(lines) - PANE_HEIGHT, 0)
+    with open(os.path.join(work_dir, "history.txt"), "w") as f:
+        f.writelines(lines[:split])
+    with open(os.path.join(work_dir, "screen.txt"), "w") as f:
+        f.writelines(lines[split:])
+    env["FZF_LINKS_BENCH_HISTORY_SIZE"] = str(split)
+
+def create_source_files(base_dir:str) -> None:
+    """Create the files referred to by the synthetic captures."""
+    os.makedirs(os.path.join(base_dir, "src"), exist_ok=True)
+    for index in range(NUM_SOURCE_FILES):
+        with open(os.path.join(base_dir, "src", f"module_{index}.py"), "w") as f:
+            _ = f.write("pass\n")
+
+def synthetic_capture(num_lines:int, seed:int=0) -> str:
+    """Return a pane capture mixing URLs, paths, git remotes and Python tracebacks with plain text."""
+    rng = random.Random(seed)
+    words = ("build", "done", "warning", "the", "value", "of", "index", "42", "ok", "failed", "-", "=>")
+
+    def noise(num_words:int) -> str:
+        return ' '.join(rng.choice(words) for _ in range(num_words))
+
+    lines:list[str] = []
+    while len(lines) < num_lines:
+        kind = rng.random()
+        n = rng.randrange(10000)
+        k = rng.randrange(NUM_SOURCE_FILES)
+        if kind < 0.10:
+            lines.append(f"{noise(3)} https://example.com/docs/{n}/page?ref={k}#top {noise(2)}")
+        elif kind < 0.20:
+            lines.append(f"\tmodified:   src/module_{k}.py")
+        elif kind < 0.25:
+            lines.append(f"{noise(2)} /usr/lib/libfoo.so.{n} {noise(2)}")
+        elif kind < 0.30:
+            lines.append(f"remote: git@github.com:org{k}/repo{n}.git ({noise(1)})")
+        elif kind < 0.35:
+            lines.extend((
+                "Traceback (most recent call last):",
+                f"  File \"src/module_{k}.py\", line {n % 500 + 1}, in func_{n}",
+                f"    {noise(4)}",
+                f"ValueError: {noise(5)}",
+            ))
+        else:
+            lines.append(noise(rng.randrange(4, 16)))
+    return '\n'.join(lines[:num_lines]) + '\n'
+
+def plugin_args(history_lines:int=0, scan_cache:bool=False, log_filename:str="", trace:bool=False, scan_processes:int=0, nearest_links:int=0, scheme_time_budget:int=0) -> list[str]:
+    """Positional arguments of the key binding with the default options of the plugin.
+
+    Links are opened with `true`, so that nothing is launched.
+    """
+    return [str(history_lines), "true '%file'", "true '%url'",
+        "-w 100% --maxnum-displayed 15 --multi -0 --no-preview", "",
+        "WARNING", "DEBUG", log_filename, "", "on", "", "0",
+        "on" if scan_cache else "off", "on" if trace else "off", "on", "pane", str(scan_processes), str(nearest_links), "off", str(scheme_time_budget), "off"]
+
+__all__ = []
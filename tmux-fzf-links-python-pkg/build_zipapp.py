@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Bundle the package into a single zip archive with precompiled bytecode.
+#
+# Python imports the modules of the archive with one `open` instead of a
+# directory lookup per module, and the bytecode stored next to each source
+# never needs to be recompiled or checked against the source. The archive is
+# picked up by `fzf-links.tmux` when it is newer than the sources.
+#
+# Usage: python3 build_zipapp.py [output]
+
+import os
+import sys
+import py_compile
+import importlib.util
+import tempfile
+import zipfile
+
+PACKAGE = "tmux_fzf_links"
+DEFAULT_OUTPUT = f"{PACKAGE}.pyz"
+
+def build(package_dir:str, output:str) -> None:
+    """Write the sources of the package and their bytecode to the archive `output`."""
+    tmp_fd, tmp_path = tempfile.mkstemp(suffix=".pyz", dir=os.path.dirname(os.path.abspath(output)))
+    os.close(tmp_fd)
+    try:
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_STORED) as archive:
+            for name in sorted(os.listdir(package_dir)):
+                if not name.endswith(".py"):
+                    continue
+                source = os.path.join(package_dir, name)
+                archive.write(source, f"{PACKAGE}/{name}")
+
+                # zipimport looks for the bytecode next to the source, not in __pycache__;
+                # unchecked hash-based bytecode is never validated against the source
+                pyc_path = py_compile.compile(
+                    source,
+                    cfile=os.path.join(tempfile.gettempdir(), f"{PACKAGE}-{name}c"),
+                    dfile=f"{PACKAGE}/{name}",
+                    doraise=True,
+                    invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+                )
+                # `doraise` turns a failure into an exception rather than None
+                assert pyc_path is not None
+                archive.write(pyc_path, f"{PACKAGE}/{name}c")
+                os.unlink(pyc_path)
+
+            # Allow running the archive directly: python3 tmux_fzf_links.pyz ...
+            archive.writestr("__main__.py", f"import sys\nfrom {PACKAGE}.__main__ import main\nsys.exit(main())\n")
+        os.replace(tmp_path, output)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def main() -> int:
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    output = sys.argv[1] if len(sys.argv) > 1 else os.path.join(base_dir, DEFAULT_OUTPUT)
+    build(os.path.join(base_dir, PACKAGE), output)
+    print(f"built {output} with bytecode for Python {sys.version_info[0]}.{sys.version_info[1]} (magic {importlib.util.MAGIC_NUMBER.hex()})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
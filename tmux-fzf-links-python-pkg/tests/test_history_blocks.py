@@ -0,0 +1,71 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+import random
+
+import pytest
+
+from tmux_fzf_links.__main__ import history_blocks
+from tmux_fzf_links.escapes import Hyperlink
+
+WIDTH = 80
+
+class WrappingPane:
+    """History of a pane that wraps its lines at a fixed width, captured as with `capture-pane -J`."""
+
+    def __init__(self, lines:list[str]):
+        # Index of the line and text of each row
+        self.rows:list[tuple[int,str]] = [
+            (index, line[offset:offset + WIDTH])
+            for index, line in enumerate(lines)
+            for offset in range(0, max(len(line), 1), WIDTH)
+        ]
+
+    def capture(self, start:str, end:str) -> tuple[str,list[Hyperlink]]:
+        rows = self.rows[len(self.rows) + int(start):len(self.rows) + int(end) + 1]
+        joined:list[str] = []
+        for row, (index, text) in enumerate(rows):
+            if row and index == rows[row - 1][0]:
+                joined[-1] += text
+            else:
+                joined.append(text)
+        content = ''.join(f"{line}\n" for line in joined)
+        # Every captured line is a hyperlink to itself
+        hyperlinks:list[Hyperlink] = []
+        position = 0
+        for line in joined:
+            hyperlinks.append((position, position + len(line), line))
+            position += len(line) + 1
+        return content, hyperlinks
+
+def random_lines(num_lines:int) -> list[str]:
+    rng = random.Random(num_lines)
+    # Lines long enough to wrap over several rows, and blank lines
+    return [
+        f"{index}:" + "x" * rng.choice([0, 5, 70, 150, 400, 1200]) if rng.random() > 0.1 else ""
+        for index in range(num_lines)
+    ]
+
+@pytest.mark.parametrize("num_lines", [100, 3000, 12000])
+def test_blocks_hold_every_line_whole(num_lines:int):
+    lines = random_lines(num_lines)
+    pane = WrappingPane(lines)
+    blocks = list(history_blocks(pane.capture, len(pane.rows), len(pane.rows)))
+
+    # The blocks move back from the screen
+    assert ''.join(content for content, _ in reversed(blocks)) == ''.join(f"{line}\n" for line in lines)
+    for content, hyperlinks in blocks:
+        for link_start, link_end, target in hyperlinks:
+            assert content[link_start:link_end] == target
+
+def test_blocks_hold_whole_lines_of_a_partial_history():
+    lines = random_lines(3000)
+    pane = WrappingPane(lines)
+    num_rows = len(pane.rows) // 2
+    blocks = list(history_blocks(pane.capture, num_rows, len(pane.rows)))
+
+    scanned = ''.join(content for content, _ in reversed(blocks))
+    # Only lines starting before the requested rows may be missing
+    first_line = pane.rows[len(pane.rows) - num_rows][0]
+    assert scanned in (''.join(f"{line}\n" for line in lines[first_line:]), ''.join(f"{line}\n" for line in lines[first_line + 1:]))
@@ -0,0 +1,87 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+import threading
+from pathlib import Path
+
+import pytest
+
+from tmux_fzf_links import pathindex
+from tmux_fzf_links.pathindex import ProjectIndex, project_index
+from tmux_fzf_links.pathinfo import path_info_cache
+
+PROJECT_FILES = [
+    "pyproject.toml",
+    "src/pkg/module.py",
+    "src/pkg/util.py",
+    "tests/module.py",
+    "docs/readme.md",
+]
+
+@pytest.fixture
+def project(tmp_path:Path, monkeypatch:pytest.MonkeyPatch) -> Path:
+    # The indexes are cached in the runtime directory
+    monkeypatch.setenv("TMUX_TMPDIR", str(tmp_path / "runtime"))
+    root = tmp_path / "project"
+    for rel_path in PROJECT_FILES:
+        (root / rel_path).parent.mkdir(parents=True, exist_ok=True)
+        (root / rel_path).touch()
+    path_info_cache.clear()
+    project_index.clear()
+    return root
+
+@pytest.mark.parametrize("file_path_str, expected", [
+    ("pkg/module.py", "src/pkg/module.py"),
+    ("./src/pkg/util.py", "src/pkg/util.py"),
+    ("util.py", "src/pkg/util.py"),
+    # Absolute paths of another root, e.g. of a CI machine
+    ("/home/ci/build/src/pkg/module.py", "src/pkg/module.py"),
+    ("/home/ci/build/tests/module.py", "tests/module.py"),
+    # Two files are named alike
+    ("module.py", None),
+    # Only the name of the file matches
+    ("/usr/share/doc/readme.md", None),
+    # Bare words and parent directories are not looked up
+    ("readme", None),
+    ("../pkg/module.py", None),
+    ("pkg/missing.py", None),
+])
+def test_find(project:Path, file_path_str:str, expected:str | None):
+    project_index.prepare(project)
+    found = project_index.find(file_path_str, project / "src")
+    assert found == (project / expected if expected is not None else None)
+
+def test_find_does_not_wait_for_the_index(project:Path, monkeypatch:pytest.MonkeyPatch):
+    release = threading.Event()
+    build = pathindex.build_project_index
+    def slow_build(root:Path) -> ProjectIndex | None:
+        _ = release.wait()
+        return build(root)
+    monkeypatch.setattr(pathindex, "build_project_index", slow_build)
+
+    # Nothing is indexed yet
+    assert project_index.find("pkg/module.py", project) is None
+    release.set()
+    project_index.prepare(project)
+    assert project_index.find("pkg/module.py", project) == project / "src/pkg/module.py"
+
+def test_find_uses_the_last_index_until_it_is_rebuilt(project:Path, monkeypatch:pytest.MonkeyPatch):
+    project_index.prepare(project)
+    (project / "src/pkg/added.py").touch()
+    path_info_cache.clear()
+    project_index.clear()
+
+    release = threading.Event()
+    build = pathindex.build_project_index
+    def slow_build(root:Path) -> ProjectIndex | None:
+        _ = release.wait()
+        return build(root)
+    monkeypatch.setattr(pathindex, "build_project_index", slow_build)
+
+    # The index out of date is served while it is rebuilt
+    assert project_index.find("pkg/module.py", project) == project / "src/pkg/module.py"
+    assert project_index.find("pkg/added.py", project) is None
+    release.set()
+    project_index.prepare(project)
+    assert project_index.find("pkg/added.py", project) == project / "src/pkg/added.py"
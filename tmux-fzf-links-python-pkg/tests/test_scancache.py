@@ -0,0 +1,96 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+import re
+
+import pytest
+
+from tmux_fzf_links.escapes import Hyperlink
+from tmux_fzf_links.opener import OpenerType, SchemeEntry
+from tmux_fzf_links.scancache import OVERLAP_LINES, PaneScanCache
+from tmux_fzf_links.scanner import Scanner
+
+SCHEMES:list[SchemeEntry] = [
+    {"tags": ("word",), "opener": OpenerType.CUSTOM, "pre_handler": None, "post_handler": None, "regex": re.compile(r"\b[a-z]+\d+\b")},
+]
+
+HISTORY_LIMIT = 1000
+
+class FakePane:
+    """History of a pane, captured as `tmux capture-pane` would."""
+
+    def __init__(self, lines:list[str]):
+        self.lines = lines
+        self.captured:list[int] = []
+
+    def capture(self, num_lines:int) -> tuple[str,list[Hyperlink]]:
+        self.captured.append(num_lines)
+        return ''.join(f"{line}\n" for line in self.lines[-num_lines:]), []
+
+def _history(cache:PaneScanCache, pane:FakePane) -> tuple[str,list[list[tuple[int,str]]]]:
+    text, matches_by_scheme, _ = cache.history(len(pane.lines), HISTORY_LIMIT, pane.capture)
+    return text, [[(match.start(), match.group()) for match in matches] for matches in matches_by_scheme]
+
+def _scanned(pane:FakePane, history_lines:int) -> tuple[str,list[list[tuple[int,str]]]]:
+    """Return the history and its matches, as a scan without cache finds them."""
+    return _history(PaneScanCache(Scanner(SCHEMES), history_lines=history_lines), FakePane(pane.lines))
+
+def _lines(prefix:str, count:int) -> list[str]:
+    return [f"{prefix} line{index} of the pane" for index in range(count)]
+
+def test_history_reuses_the_cached_lines():
+    pane = FakePane(_lines("old", 30))
+    cache = PaneScanCache(Scanner(SCHEMES), history_lines=100)
+    _ = _history(cache, pane)
+    pane.lines += _lines("new", 5)
+    assert _history(cache, pane) == _scanned(pane, 100)
+    assert pane.captured == [100, 5 + OVERLAP_LINES]
+
+def test_history_drops_the_lines_out_of_range():
+    pane = FakePane(_lines("old", 30))
+    cache = PaneScanCache(Scanner(SCHEMES), history_lines=30)
+    _ = _history(cache, pane)
+    pane.lines += _lines("new", 7)
+    assert _history(cache, pane) == _scanned(pane, 30)
+    assert pane.captured == [30, 7 + OVERLAP_LINES]
+
+def test_history_joins_a_wrapped_first_line():
+    pane = FakePane(_lines("old", 30))
+    cache = PaneScanCache(Scanner(SCHEMES), history_lines=100)
+    _ = _history(cache, pane)
+    pane.lines += _lines("new", 3)
+    # The first captured line is the end of a line wrapped in the pane
+    capture = pane.capture
+    def capture_wrapped(num_lines:int) -> tuple[str,list[Hyperlink]]:
+        text, hyperlinks = capture(num_lines)
+        return text.split("line", 1)[1], hyperlinks
+    pane.capture = capture_wrapped
+    assert _history(cache, pane) == _scanned(pane, 100)
+    assert pane.captured == [100, 3 + OVERLAP_LINES]
+
+@pytest.mark.parametrize("old_tail, captured", [
+    # The first captured line is empty
+    ([], ["", *_lines("cleared", 5)]),
+    # The first captured line is the end of the last cached line
+    ([], ["of the pane", *_lines("cleared", 5)]),
+    # The captured lines are blank, as were the last cached lines
+    (["", "", "", ""], ["", "", "", "", "", ""]),
+])
+def test_history_is_scanned_again_after_a_clear(old_tail:list[str], captured:list[str]):
+    pane = FakePane([*_lines("old", 30), *old_tail])
+    cache = PaneScanCache(Scanner(SCHEMES), history_lines=100)
+    _ = _history(cache, pane)
+    # The history was cleared, then grew beyond its previous size
+    num_added = len(captured) - OVERLAP_LINES
+    pane.lines = [*_lines("cleared", len(pane.lines) + num_added - len(captured)), *captured]
+    assert _history(cache, pane) == _scanned(pane, 100)
+    assert pane.captured == [100, len(captured), 100]
+
+def test_history_is_scanned_again_when_it_shrinks():
+    pane = FakePane(_lines("old", 30))
+    cache = PaneScanCache(Scanner(SCHEMES), history_lines=100)
+    _ = _history(cache, pane)
+    pane.lines = _lines("cleared", 10)
+    assert _history(cache, pane) == _scanned(pane, 100)
+    assert pane.captured == [100, 100]
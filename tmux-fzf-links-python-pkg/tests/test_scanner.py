@@ -0,0 +1,151 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+import re
+
+import pytest
+
+from tmux_fzf_links import scanner
+from tmux_fzf_links.default_schemes import default_schemes
+from tmux_fzf_links.opener import OpenerType, SchemeEntry
+from tmux_fzf_links.scanner import Scanner, _prefilter
+
+SAMPLE_LINES = [
+    "build done https://example.com/docs/12/page?ref=3#top => ok",
+    "\tmodified:   src/module_4.py",
+    "warning /usr/lib/libfoo.so.7 value of index",
+    "remote: git@github.com:org1/repo2.git (failed)",
+    "Traceback (most recent call last):",
+    "  File \"src/module_1.py\", line 17, in func_3",
+    "ValueError: the value of index 42",
+    "see 'docs/user guide.md' and ~/notes.txt, or http://www.python.org.",
+    "abab aBAB xx-yy 1.2.3.4 10.0.0.1:80 ftp://10.0.0.2 TODO fix",
+    "",
+    "ERROR: Disk full ab",
+    "ab",
+]
+
+def _scheme(tag:str, pattern:str, flags:int=0) -> SchemeEntry:
+    return {"tags": (tag,), "opener": OpenerType.CUSTOM, "pre_handler": None, "post_handler": None, "regex": re.compile(pattern, flags)}
+
+# Patterns with back-references, flags, empty matches and look-behind, which
+# the prefilter must leave matching as `finditer` does
+EXTRA_SCHEMES = [
+    _scheme("backreference", r"\b(\w+)\1\b"),
+    _scheme("named backreference", r"(?P<half>[a-z]{2})(?P=half)"),
+    _scheme("global ignore case", r"(?i)error: \w+"),
+    _scheme("ignore case flag", r"abab", re.IGNORECASE),
+    _scheme("global multiline", r"(?m)^ab$"),
+    _scheme("multiline flag", r"ab$", re.MULTILINE),
+    _scheme("empty", r"x*"),
+    _scheme("empty alternative", r"\b|-"),
+    _scheme("lookbehind", r"(?<!://)\b(?:\d{1,3}\.){3}\d{1,3}\b(?::\d+)?"),
+    _scheme("positive lookbehind", r"(?<=TODO )\w+"),
+]
+
+SCHEME_SETS = {
+    "default": default_schemes,
+    "extra": EXTRA_SCHEMES,
+    "mixed": [*default_schemes[:3], *EXTRA_SCHEMES, default_schemes[3]],
+}
+
+def _sample_text(repeat:int) -> str:
+    return '\n'.join(SAMPLE_LINES * repeat)
+
+def _expected(schemes:list[SchemeEntry], content:str, start:int) -> list[list[tuple[int,int]]]:
+    return [[match.span() for match in scheme["regex"].finditer(content, start)] for scheme in schemes]
+
+def _spans(results:list[list[re.Match[str]]]) -> list[list[tuple[int,int]]]:
+    return [[match.span() for match in matches] for matches in results]
+
+@pytest.mark.parametrize("name", SCHEME_SETS)
+@pytest.mark.parametrize("start", [0, 1, 150, 777])
+def test_scan_matches_finditer(name:str, start:int):
+    schemes = SCHEME_SETS[name]
+    content = _sample_text(20)
+    assert _spans(Scanner(schemes).scan(content, start)) == _expected(schemes, content, start)
+
+@pytest.mark.parametrize("name", SCHEME_SETS)
+def test_scan_without_parser_matches_finditer(name:str, monkeypatch:pytest.MonkeyPatch):
+    # The private parser of `re` is missing or incompatible
+    monkeypatch.setattr(scanner, "_parser", None)
+    schemes = SCHEME_SETS[name]
+    scan = Scanner(schemes)
+    assert not scan._line_literals and not scan._literals
+    content = _sample_text(5)
+    assert _spans(scan.scan(content, 3)) == _expected(schemes, content, 3)
+
+def test_scan_with_failing_analysis_matches_finditer(monkeypatch:pytest.MonkeyPatch):
+    def fail(*_):
+        raise TypeError("unexpected parse tree")
+    monkeypatch.setattr(scanner, "_prefilter", fail)
+    schemes = SCHEME_SETS["mixed"]
+    content = _sample_text(5)
+    assert _spans(Scanner(schemes).scan(content)) == _expected(schemes, content, 0)
+
+@pytest.mark.parametrize("pattern, flags, literals, expected", [
+    (r"foo\d+bar", 0, None, (("foo",), True)),
+    (r"(?:ab)?cde", 0, None, (("cde",), True)),
+    (r"(?i)https?://", 0, None, (None, True)),
+    (r"x|y", 0, None, (None, True)),
+    (r"foo\s+bar", 0, None, (("foo",), False)),
+    (r"a.b", re.DOTALL, None, (("a",), False)),
+    (r"ab$", 0, None, (("ab",), False)),
+    (r"(\w)\1", 0, None, (None, False)),
+    (r"\w+", 0, ("x", "y"), (("x", "y"), True)),
+])
+def test_prefilter(pattern:str, flags:int, literals:tuple[str,...] | None, expected:tuple[tuple[str,...] | None,bool]):
+    assert _prefilter(re.compile(pattern, flags), literals) == expected
+
+# Lines whose links sit at the edges of the lines, so that some of them
+# start or end a chunk, together with links spanning two lines
+BOUNDARY_LINES = [
+    "https://example.com/first",
+    "TODO fix src/module_1.py",
+    "foo",
+    "bar at the end https://example.com/last",
+    "ab",
+    "1.2.3.4",
+]
+
+BOUNDARY_SCHEMES = [
+    *default_schemes,
+    _scheme("across lines", r"foo\s+bar"),
+    _scheme("multiline flag", r"^ab$", re.MULTILINE),
+    _scheme("lookbehind", r"(?<!://)\b(?:\d{1,3}\.){3}\d{1,3}\b"),
+    _scheme("positive lookbehind", r"(?<=TODO )\w+"),
+]
+
+@pytest.fixture
+def parallel_scan(monkeypatch:pytest.MonkeyPatch):
+    # Any text is worth the process pool
+    monkeypatch.setattr(scanner, "PARALLEL_SCAN_MIN_CHARS", 0)
+    yield
+    scanner._discard_process_pool()
+
+@pytest.mark.parametrize("num_processes", [2, 3, 7])
+@pytest.mark.parametrize("start", [0, 5, 400])
+def test_scan_in_processes_matches_single_process(parallel_scan:None, num_processes:int, start:int):
+    content = '\n'.join(BOUNDARY_LINES * 50)
+    scan = Scanner(BOUNDARY_SCHEMES)
+    chunks = scanner._line_chunks(content, start, num_processes)
+    assert len(chunks) > 1
+    expected = _expected(BOUNDARY_SCHEMES, content, start)
+    assert _spans(scan.scan(content, start)) == expected
+    assert _spans(scan.scan(content, start, num_processes)) == expected
+
+class _BrokenPool:
+    def submit(self, *_):
+        from concurrent.futures.process import BrokenProcessPool
+        raise BrokenProcessPool("a worker process died")
+
+@pytest.mark.parametrize("error", [OSError("no forkserver"), None])
+def test_scan_in_processes_falls_back_to_single_process(parallel_scan:None, monkeypatch:pytest.MonkeyPatch, error:OSError | None):
+    def get_process_pool(_:int) -> _BrokenPool:
+        if error is not None:
+            raise error
+        return _BrokenPool()
+    monkeypatch.setattr(scanner, "_get_process_pool", get_process_pool)
+    content = '\n'.join(BOUNDARY_LINES * 10)
+    assert _spans(Scanner(BOUNDARY_SCHEMES).scan(content, 0, 4)) == _expected(BOUNDARY_SCHEMES, content, 0)
@@ -6,20 +6,50 @@
 
 import os
 import re
-import subprocess
 import sys
 import logging
-import importlib.util
-import pathlib
+import queue
+import threading
+import time
+from pathlib import Path
+from collections.abc import Callable, Iterator
 
-from tmux_fzf_links.fzf_handler import run_fzf
 from .colors import colors
 from .configs import configs
-from typing import override
-
-from .opener import OpenerType, PreHandledMatch, open_link, SchemeEntry
-from .errors_types import CommandFailed, FailedChDir, FzfError, FzfUserInterrupt, MissingPostHandler, NoSuitableAppFound, PatternNotMatching, LsColorsNotConfigured
-from .default_schemes import default_schemes
+from typing import TYPE_CHECKING, override
+
+from .opener import LaunchedOpener, OpenerType, PreHandledMatch, SchemeEntry, launch_link, wait_for_openers
+from .errors_types import CommandFailed, FailedChDir, FailedResolvePath, FzfError, FzfUserInterrupt, MissingPostHandler, NoSuitableAppFound, PatternNotMatching, LsColorsNotConfigured
+from .default_schemes import default_schemes, hyperlink_scheme
+from .escapes import Hyperlink, parse_escape_sequences
+from .scanner import get_scanner
+from .scancache import PaneScanCache, cache_path
+from .tmux import tmux
+from .tracing import tracer, print_stats
+from .pathinfo import path_info_cache
+from .pathindex import project_index
+from .prehandler import ClaimedSpans, pre_handle, pre_handle_matches
+from .items import ItemStore
+from .budgets import SchemeBudgets
+
+if TYPE_CHECKING:
+    from .preview import PreviewServer
+
+# Time during which log records are gathered into a single tmux message
+TMUX_LOG_COALESCE_INTERVAL = 0.05
+
+# Time given to the history scan to complete before fzf is started without waiting for it
+HISTORY_SETTLE_TIMEOUT = 0.1
+
+# Interval at which the batches of the history scan are checked for fzf having exited
+BATCH_POLL_INTERVAL = 0.05
+
+# Number of history lines of the first block captured when only the nearest
+# links are requested; each following block is twice as large, up to the maximum
+NEAREST_FIRST_BLOCK_LINES = 500
+NEAREST_MAX_BLOCK_LINES = 8000
+# Number of history lines of a block captured again with the next, older block
+NEAREST_OVERLAP_LINES = 20
 
 def set_up_logger(loglevel_tmux:str,loglevel_file:str,log_filename:str) -> logging.Logger:
 
@@ -30,6 +60,11 @@ def set_up_logger(loglevel_tmux:str,loglevel_file:str,log_filename:str) -> loggi
     # Allow all log messages to pass through; we control the level using handlers
     logger.setLevel(0)
 
+    # Remove the handlers of a previous run (e.g., when serving requests in daemon mode)
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+        handler.close()
+
     # Set up tmux log handler
     tmux_handler = setup_tmux_log_handler()
     tmux_handler.setLevel(validate_log_level(loglevel_tmux))
@@ -70,30 +105,66 @@ def set_up_logger(loglevel_tmux:str,loglevel_file:str,log_filename:str) -> loggi
 # >>> LOGGER >>>
 
 class TmuxDisplayHandler(logging.Handler):
+    """Show the log records in the tmux status line without blocking the caller.
+
+    Records are displayed by a background thread. A burst of records is
+    merged into a single message, showing the most severe record followed
+    by the number of records left out.
+    """
+
+    def __init__(self, level:int=logging.NOTSET):
+        super().__init__(level)
+        self._queue:queue.Queue[tuple[int,str]] = queue.Queue()
+        self._thread:threading.Thread | None = None
+        # Records emitted concurrently must not start two display threads
+        self._thread_lock = threading.Lock()
+
     @override
     def emit(self, record:logging.LogRecord):
-        # Format the log message
-        message = self.format(record)
         try:
-            # Determine the display command options based on the log level
-            display_options = ["tmux", "display-message"]
-            if record.levelno >= logging.WARNING:
-                display_options.extend(["-d", "0"])  # Pause the message for warnings and errors
-
-            # Include the message
-            display_options.append(message)
-
-            # Use tmux display-message to show the log
-            _ = subprocess.run(
-                display_options,
-                check=True,
-                shell=False,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            )
-        except Exception as e:
-            # Fallback to console if tmux command fails
-            print(f"Failed to display message in tmux: {e}")
+            # Format the log message
+            self._queue.put((record.levelno, self.format(record)))
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._display_messages, daemon=True)
+                    self._thread.start()
+        except Exception:
+            self.handleError(record)
+
+    def _display_messages(self):
+        while True:
+            burst = [self._queue.get()]
+            # Give the rest of the burst a moment to arrive
+            deadline = time.monotonic() + TMUX_LOG_COALESCE_INTERVAL
+            while (timeout := deadline - time.monotonic()) > 0:
+                try:
+                    burst.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            levelno, message = max(burst, key=lambda entry: entry[0])
+            if len(burst) > 1:
+                message = f"{message} (+{len(burst)-1} more)"
+            try:
+                # Use tmux display-message to show the log; pause the message for warnings and errors
+                tmux.display_message(message, persistent=levelno >= logging.WARNING)
+            except Exception as e:
+                # Fallback to console if tmux command fails
+                print(f"Failed to display message in tmux: {e}")
+            finally:
+                for _ in burst:
+                    self._queue.task_done()
+
+    @override
+    def flush(self):
+        """Wait until all the records have been displayed."""
+        if self._thread is not None:
+            self._queue.join()
+
+    @override
+    def close(self):
+        self.flush()
+        super().close()
 
 def setup_tmux_log_handler() -> TmuxDisplayHandler:
 
@@ -141,11 +212,27 @@ def validate_log_level(user_level:str):
 
 # <<< LOGGER <<<
 
+# Schemes of the user modules already loaded, keyed by their path, modification time and size
+_user_modules_cache:dict[tuple[str,int,int],tuple[list[SchemeEntry],list[str]]] = {}
+
 def load_user_module(file_path: str) -> tuple[list[SchemeEntry],list[str]]:
-    """Dynamically load a Python module from the given file path."""
+    """Dynamically load a Python module from the given file path.
+
+    The module is executed again only when the file has changed since it was
+    last loaded by this process.
+    """
+    # Imported here: only needed when the user provides custom schemes
+    import importlib.util
+
     try:
         # Ensure the file path is absolute
-        file_path = str(pathlib.Path(file_path).resolve())
+        file_path = os.path.realpath(file_path)
+
+        file_stat = os.stat(file_path)
+        cache_key = (file_path, file_stat.st_mtime_ns, file_stat.st_size)
+        cached = _user_modules_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
         # Create a module spec
         spec = importlib.util.spec_from_file_location("user_schemes_module", file_path)
@@ -169,21 +256,229 @@ def load_user_module(file_path: str) -> tuple[list[SchemeEntry],list[str]]:
             if not isinstance(rm_default_schemes, list):
                 raise TypeError(f"'rm_default_schemes' must be a list, got {type(rm_default_schemes)}")
             
-            return (user_schemes,rm_default_schemes,)
+            _user_modules_cache.clear()
+            _user_modules_cache[cache_key] = (user_schemes,rm_default_schemes,)
+            return _user_modules_cache[cache_key]
         else:
             raise ImportError(f"cannot create a module spec for {file_path}")
     except Exception as e:
         raise ImportError(f"failed to load user module: {e}")
 
+def merge_schemes(user_schemes:list[SchemeEntry], rm_default_schemes:list[str]) -> list[SchemeEntry]:
+    """Merge the user schemes with the default ones, giving precedence to user schemes."""
+    # Set of schemes of already checked out
+    schemes:list[SchemeEntry] = []
+    checked:set[str] = set()
+    for scheme in user_schemes + default_schemes:
+        # if none of the tags is already present in 'checked'
+        if all(tag not in checked and tag not in rm_default_schemes for tag in scheme["tags"]):
+            schemes.append(scheme)
+    return schemes
+
 def trim_str(s:str) -> str:
     """Trim leading and trailing spaces from a string."""
     return s.strip()
 
-def remove_escape_sequences(text:str) -> str:
-    # Regular expression to match ANSI escape sequences
-    ansi_escape_pattern = r'\x1B\[[0-9;]*[mK]'
-    # Replace escape sequences with an empty string
-    return re.sub(ansi_escape_pattern, '', text)
+def capture_pane(start:str | None=None, end:str | None=None) -> tuple[str,list[Hyperlink]]:
+    """Capture the content of the current pane and remove its escape sequences.
+
+    `start` and `end` are the line numbers passed to `capture-pane -S/-E`.
+    Return the plain text and the hyperlinks found in the escape sequences.
+    """
+    with tracer.stage("capture history"):
+        content = tmux.capture(start, end)
+    with tracer.stage("parse escape sequences"):
+        return parse_escape_sequences(content)
+
+def count_lines_to_keep(lines:list[str], newer_lines:list[str]) -> int:
+    """Return how many lines of a block of history to keep, up to the first line of the newer block, which it ends by capturing again.
+
+    The shared rows hold the first line of the newer block, whole here, and
+    lines already found whole in the newer block; the last of them may be
+    cut short by the end of the capture.
+    """
+    carried = newer_lines[0]
+    for index in range(max(len(lines) - 1 - NEAREST_OVERLAP_LINES, 0), len(lines)):
+        num_after = len(lines) - 1 - index
+        if lines[index].endswith(carried) and (num_after == 0 or (num_after < len(newer_lines)
+                and lines[index+1:-1] == newer_lines[1:num_after] and newer_lines[num_after].startswith(lines[-1]))):
+            return index + 1
+    # The carried line spans all the shared rows and its beginning is lost
+    return len(lines) - 1
+
+def history_blocks(
+        capture:Callable[[str,str],tuple[str,list[Hyperlink]]],
+        num_lines:int,
+        history_size:int
+    ) -> Iterator[tuple[str,list[Hyperlink]]]:
+    """Capture the last `num_lines` lines of the history in blocks moving back from the screen, and yield the text and the hyperlinks of each.
+
+    Each block is twice as large as the previous one, up to a maximum. The
+    first line of a block may be the end of a line wrapped from the rows
+    before it: it is left to the next block, which captures again the first
+    rows of this one to find it whole. A line wrapped over more rows than
+    that may be missed.
+    """
+    num_scanned = 0
+    block_lines = NEAREST_FIRST_BLOCK_LINES
+    newer_lines:list[str] | None = None
+    while num_scanned < num_lines:
+        block_start = min(num_scanned + block_lines, num_lines)
+        block_end = num_scanned + 1 if newer_lines is None else max(num_scanned + 1 - NEAREST_OVERLAP_LINES, 1)
+        content, hyperlinks = capture(f'-{block_start}', f'-{block_end}')
+        lines = content.split('\n')[:-1]
+        num_kept = len(lines) if newer_lines is None else count_lines_to_keep(lines, newer_lines)
+        # Only the oldest line of the history is known to be whole
+        num_carried = 0 if block_start == history_size else 1
+        start = sum(len(line) + 1 for line in lines[:num_carried])
+        end = max(sum(len(line) + 1 for line in lines[:num_kept]), start)
+        yield content[start:end], [
+            (link_start - start, link_end - start, target)
+            for link_start, link_end, target in hyperlinks if link_start >= start and link_end <= end
+        ]
+        newer_lines = lines
+        num_scanned = block_start
+        block_lines = min(2 * block_lines, NEAREST_MAX_BLOCK_LINES)
+
+def collect_items(
+        matches_by_scheme:list[list[re.Match[str]]],
+        schemes:list[SchemeEntry],
+        seen:set[str],
+        pre_handled:set[tuple[tuple[str,...],str]],
+        num_threads:int,
+        stop_event:threading.Event | None=None,
+        content:str='',
+        hyperlinks:list[Hyperlink] | None=None,
+        pane_id:str='',
+        budgets:SchemeBudgets | None=None
+    ) -> ItemStore:
+    """Pre-handle the matches found by the scanner, sorted from the most recent to the oldest.
+
+    Matched texts already in `seen` are skipped, and the new ones are added to it.
+    Schemes are processed in order of precedence: the matches overlapping the
+    text of a link accepted by a previous scheme are dropped.
+    Each text is pre-handled once per scheme, at its most recent occurrence;
+    the texts pre-handled are recorded in `pre_handled` together with the
+    tags of the scheme, so that texts rejected before are not pre-handled again.
+    The `hyperlinks` found in `content` are included as matches of the
+    hyperlink scheme, and replace the matches of the other schemes in their text.
+    Items are tagged with `pane_id`, the pane in which they were found, and
+    keep their match and scheme, which are handed to the post_handler as they are.
+    The time spent by the pre_handler of each scheme is charged to its
+    `budgets`; a scheme that runs out of time keeps the links accepted so far.
+    """
+    logger = logging.getLogger()
+    items = ItemStore()
+
+    # Text already claimed by a link, in order of precedence: the hyperlinks
+    # first, then the accepted matches of each scheme in turn
+    claimed = ClaimedSpans()
+
+    if hyperlinks:
+        claimed.add([(link_start, link_end) for link_start, link_end, _ in hyperlinks])
+
+        for link_start, link_end, target in reversed(hyperlinks):
+            match = hyperlink_scheme["regex"].match(f"{target}\x1f{content[link_start:link_end]}")
+            assert match is not None
+            entire_match = match.group(0)
+            if entire_match in seen:
+                continue
+            pre_handled_match = pre_handle(hyperlink_scheme, match)
+            if pre_handled_match:
+                seen.add(entire_match)
+                items.append(pre_handled_match,match,link_start,pane_id,hyperlink_scheme)
+
+    for index, (scheme, matches) in enumerate(zip(schemes, matches_by_scheme)):
+        if stop_event is not None and stop_event.is_set():
+            break
+        if budgets is not None and budgets.exhausted(scheme):
+            continue
+
+        # Only the most recent occurrence of a text not handled yet is
+        # pre-handled, so that a link repeated many times is pre-handled once
+        matches = claimed.unclaimed(matches)
+        latest:dict[str,re.Match[str]] = {}
+        for match in matches:
+            latest[match.group(0)] = match
+        latest = {text: match for text, match in latest.items()
+            if text not in seen and (scheme["tags"], text) not in pre_handled}
+
+        # Process each match, possibly pre-handling them concurrently
+        handle_start = time.perf_counter()
+        for _, match, pre_handled_match in pre_handle_matches([scheme], [list(latest.values())], num_threads):
+            if stop_event is not None and stop_event.is_set():
+                break
+            if budgets is not None and budgets.budget:
+                now = time.perf_counter()
+                if not budgets.charge(scheme, now - handle_start):
+                    break
+                handle_start = now
+            entire_match = match.group(0)
+            match_start = match.start()
+            pre_handled.add((scheme["tags"], entire_match))
+            # Skip matches for which the pre_handler returns None
+            # Skip matches for texts that has already been processed by a previous scheme
+            if pre_handled_match and entire_match not in seen:
+                if pre_handled_match["tag"] not in scheme["tags"]:
+                    logger.warning(f"the dynamically returned '{pre_handled_match["tag"]}' is not included in: {scheme["tags"]}")
+                    continue
+
+                seen.add(entire_match)
+                # We keep the original match for the post_handler
+                items.append(pre_handled_match,match,match_start,pane_id,scheme)
+
+        # Every occurrence of an accepted text is claimed by this scheme
+        if index < len(schemes) - 1:
+            claimed.add([match.span() for match in matches if match.group(0) in seen])
+
+    # Sort items
+    items.sort_by_position(reverse=True)
+    return items
+
+class ChoiceEncoder:
+    """Format the items as fzf choices.
+
+    Each choice starts with the number of its item followed by a tab; this
+    field is hidden by fzf but returned with the selection, which identifies
+    the item. With `pane_labels`, the label of the pane in which each item
+    was found is shown before the link.
+
+    The parts that many choices share, the separators and the colored and
+    padded tags and pane labels, are formatted once. The colors only set the
+    foreground, so each one simply replaces the previous one, and the color
+    is reset once before the text of the link.
+    """
+
+    def __init__(self, max_len_tag_names:int, pane_labels:dict[str,str] | None=None):
+        # add 2 characters because of `[` and `]`
+        self._tag_width = max_len_tag_names + 2
+        self._separator = f" {colors.dash_color}- "
+        self._tags:dict[str,str] = {}
+        self._pane_labels:dict[str,str] | None = None
+        if pane_labels:
+            max_len_pane_labels = max(map(len, pane_labels.values()))
+            self._pane_labels = {pane_id: f"{label.ljust(max_len_pane_labels)} " for pane_id, label in pane_labels.items()}
+            self._empty_label = " " * (max_len_pane_labels + 1)
+
+    def _tag(self, tag:str) -> str:
+        formatted = self._tags.get(tag)
+        if formatted is None:
+            formatted = f"{colors.tag_color}{f'[{tag}]'.ljust(self._tag_width)}{self._separator}"
+            self._tags[tag] = formatted
+        return formatted
+
+    def number(self, items:ItemStore, first_idx:int) -> list[str]:
+        """Return the choices of the items numbered from `first_idx`."""
+        index_color = colors.index_color
+        separator = self._separator
+        reset_color = colors.reset_color
+        tags = [self._tag(tag) for tag in items.tags]
+        if self._pane_labels is None:
+            labels = [""] * len(items)
+        else:
+            labels = [self._pane_labels.get(pane_id, self._empty_label) for pane_id in items.pane_ids]
+        return [f"{idx}\t{index_color}{idx:4d}{separator}{tag}{label}{reset_color}{display_text}"
+            for idx, tag, label, display_text in zip(range(first_idx, first_idx + len(items)), tags, labels, items.display_texts)]
 
 def run(
         history_lines:str='',
@@ -196,9 +491,22 @@ def run(
         log_filename:str='',
         user_schemes_path:str='',
         use_ls_colors_str:str='',
-        ls_colors_filename:str=''
+        ls_colors_filename:str='',
+        pre_handler_threads:str='',
+        scan_cache_str:str='',
+        trace_str:str='',
+        hyperlinks_str:str='',
+        scope_str:str='',
+        scan_processes_str:str='',
+        nearest_links_str:str='',
+        project_index_str:str='',
+        scheme_time_budget_str:str='',
+        preview_str:str=''
     ):
 
+    # Time each stage of the run when requested
+    tracer.start(trace_str == 'on')
+
     configs.initialize(history_lines,
         editor_open_cmd,
         browser_open_cmd,
@@ -209,7 +517,17 @@ def run(
         log_filename,
         user_schemes_path,
         use_ls_colors_str,
-        ls_colors_filename)    
+        ls_colors_filename,
+        pre_handler_threads,
+        scan_cache_str,
+        trace_str,
+        hyperlinks_str,
+        scope_str,
+        scan_processes_str,
+        nearest_links_str,
+        project_index_str,
+        scheme_time_budget_str,
+        preview_str)    
 
     # Set up the logger
     logger = set_up_logger(loglevel_tmux,loglevel_file,log_filename)
@@ -218,35 +536,74 @@ def run(
     if path_extension and path_extension not in os.environ["PATH"]:
         os.environ["PATH"] = f"{path_extension}:{os.environ['PATH']}"
 
-    # Configure LS_COLORS
-    if use_ls_colors_str and use_ls_colors_str=='on':
-        colors.enable_colors(True)
+    # Fetch the variables and the visible screen of the tmux pane while the
+    # rest is set up; its history is captured later. The escape sequences are
+    # only kept when the OSC 8 hyperlinks are requested
+    use_hyperlinks = hyperlinks_str=='on'
+    tmux.start_snapshot(escapes=use_hyperlinks)
+
+    # Configure LS_COLORS; colors are only reset when the option changes so
+    # that the custom colors set by the user schemes are preserved
+    use_ls_colors = use_ls_colors_str=='on'
+    if colors.enabled != use_ls_colors:
+        colors.enable_colors(use_ls_colors)
 
     if colors.enabled:
-        if ls_colors_filename:
-            try:
-                colors.configure_ls_colors_from_file(ls_colors_filename)
-            except LsColorsNotConfigured as e:
-                logger.warning(f"{e}")
-        else:
-            colors.configure_ls_colors_from_env()
+        with tracer.stage("ls colors"):
+            if ls_colors_filename:
+                try:
+                    colors.configure_ls_colors_from_file(ls_colors_filename)
+                except LsColorsNotConfigured as e:
+                    logger.warning(f"{e}")
+            else:
+                colors.configure_ls_colors_from_env()
 
-    # Capture tmux content
-    capture_str:list[str]=['tmux', 'capture-pane', '-J', '-p', '-e', '-S', f'-{history_lines}']
-   
-    content = subprocess.check_output(
-            capture_str,
-            shell=False,
-            text=True,
-        )
+    # Number of threads running the pre_handlers (0: run them serially)
+    num_threads:int = 0
+    if pre_handler_threads:
+        try:
+            num_threads = max(int(pre_handler_threads),0)
+        except ValueError:
+            logger.warning(f"invalid number of pre-handler threads: {pre_handler_threads}")
+
+    # Number of processes scanning a long history (0: scan it in this process)
+    num_processes:int = 0
+    if scan_processes_str == 'auto':
+        num_processes = os.cpu_count() or 0
+    elif scan_processes_str:
+        try:
+            num_processes = max(int(scan_processes_str),0)
+        except ValueError:
+            logger.warning(f"invalid number of scan processes: {scan_processes_str}")
 
-    # Remove escape sequences
-    content=remove_escape_sequences(content)
+    # Number of links after which the history is no longer scanned (0: scan it all)
+    num_nearest_links:int = 0
+    if nearest_links_str:
+        try:
+            num_nearest_links = max(int(nearest_links_str),0)
+        except ValueError:
+            logger.warning(f"invalid number of nearest links: {nearest_links_str}")
+
+    # Time allowed to each scheme, in milliseconds (0: no limit)
+    budgets = SchemeBudgets()
+    if scheme_time_budget_str:
+        try:
+            budgets.budget = max(float(scheme_time_budget_str),0.0) / 1000
+        except ValueError:
+            logger.warning(f"invalid scheme time budget: {scheme_time_budget_str}")
+
+    # Panes scanned in addition to the current one
+    if scope_str not in ('', 'pane', 'window', 'session'):
+        logger.warning(f"invalid scope: {scope_str}")
+        scope_str = 'pane'
+    scan_other_panes = scope_str in ('window', 'session')
 
     # Load user schemes
     user_schemes:list[SchemeEntry]
+    rm_default_schemes:list[str] = []
     if user_schemes_path:
-        loaded_user_module = load_user_module(user_schemes_path)
+        with tracer.stage("load user schemes"):
+            loaded_user_module = load_user_module(user_schemes_path)
         user_schemes = loaded_user_module[0]
         rm_default_schemes = loaded_user_module[1]
         # print(rm_default_schemes)
@@ -254,165 +611,369 @@ def run(
         user_schemes = []
     
     # Merge both schemes giving precedence to user schemes
+    schemes = merge_schemes(user_schemes, rm_default_schemes)
 
-    # Set of schemes of already checked out
-    schemes:list[SchemeEntry] = []
-    checked:set[str] = set()
-    for scheme in user_schemes + default_schemes:
-        # if none of the tags is already present in 'checked'
-        if all(tag not in checked and tag not in rm_default_schemes for tag in scheme["tags"]):
-            schemes.append(scheme)
-    del checked
+    # Hyperlinks are not searched by the scanner but are listed like the
+    # matches of the other schemes, unless one of these uses the same tag
+    listed_schemes = list(schemes)
+    if any(tag in rm_default_schemes or any(tag in scheme["tags"] for scheme in schemes) for tag in hyperlink_scheme["tags"]):
+        use_hyperlinks = False
+    if use_hyperlinks:
+        listed_schemes.append(hyperlink_scheme)
 
-    # Create the new dictionary mapping tags to indexes
-    tag_to_index = {
-        tag: index
-        for index, scheme in enumerate(schemes)
-        for tag in scheme.get("tags", [])
-    }
 
     try:
         # Find pane current path
-        current_path = subprocess.check_output(
-            ('tmux', 'display', '-p', '#{pane_current_path}',),
-            shell=False,
-            text=True,
-        ).strip()
+        with tracer.stage("tmux snapshot"):
+            pane = tmux.pane()
         # Set current directory to pane current path
-        os.chdir(current_path)
+        os.chdir(pane["pane_current_path"])
     except Exception as e:
         raise FailedChDir(f"current directory could not be changed: {e}")
 
+    # Cached file metadata and colors refer to paths relative to the current directory
+    path_info_cache.clear()
+    colors.clear_file_colors()
+    project_index.clear()
+    # Files not found from the current directory are looked up in its project
+    project_index.enabled = project_index_str == 'on'
+    if project_index.enabled:
+        # The index is read, checked and rebuilt if needed meanwhile, off the critical path
+        project_index.prepare(Path.cwd(), wait=False)
+
     # We use the unique set as an expedient to sort over
     # pre_handled_text while keeping the original text
     seen:set[str] = set()
-    items:list[tuple[PreHandledMatch,str,int]] = []
+    # Texts pre-handled by each scheme, shared by the screen and the history
+    pre_handled:set[tuple[tuple[str,...],str]] = set()
+
+    # Matches found by the previous call in the same pane are reused
+    num_history_lines = int(history_lines) if history_lines.isdigit() else 0
+    scanner = get_scanner(schemes)
+    pane_cache = PaneScanCache(scanner, cache_path(pane["pane_id"]) if scan_cache_str == 'on' else None, num_history_lines, num_processes, budgets, hyperlinks_str == 'on')
+
+    # The visible screen is processed first, so that its links are shown right away
+    with tracer.stage("parse escape sequences"):
+        screen_content, screen_hyperlinks = parse_escape_sequences(tmux.screen())
+    with tracer.stage("scan screen"):
+        screen_matches = pane_cache.screen(screen_content)
+    with tracer.stage("pre-handle screen"):
+        sorted_choices = collect_items(screen_matches, schemes, seen, pre_handled, num_threads,
+            content=screen_content, hyperlinks=screen_hyperlinks if use_hyperlinks else None, pane_id=pane["pane_id"], budgets=budgets)
+    del screen_content, screen_matches
+
+    # Find the maximum length in characters of the tags
+    max_len_tag_names:int = max((len(tag) for scheme in listed_schemes for tag in scheme["tags"]), default=0)
+
+    # Panes in the scope, labeled with their window and pane indexes
+    other_panes:list[dict[str,str]] = []
+    pane_labels:dict[str,str] | None = None
+    if scan_other_panes:
+        try:
+            with tracer.stage("list panes"):
+                scope_panes = tmux.list_panes(session=scope_str == 'session')
+            pane_labels = {scope_pane["pane_id"]: f"{scope_pane["window_index"]}.{scope_pane["pane_index"]}" for scope_pane in scope_panes}
+            other_panes = [scope_pane for scope_pane in scope_panes if scope_pane["pane_id"] != pane["pane_id"]]
+        except Exception as e:
+            logger.error(f"error: failed to list the panes: {e}")
 
-    # Process each scheme
-    for scheme in schemes:
-        # Use regex.finditer to iterate over all matches
-        for match in scheme['regex'].finditer(content):
-            entire_match = match.group(0)
-            match_start = match.start()
-            # Extract the match string
-            pre_handled_match:PreHandledMatch | None
-            if scheme['pre_handler']:
-                pre_handled_match = scheme['pre_handler'](match)
-            else:
-                # fallback case when no pre_handler is provided for the scheme
-                pre_handled_match = {
-                    "display_text": entire_match,
-                    "tag": scheme["tags"][0]
-                }
-            # Skip matches for which the pre_handler returns None
-            # Skip matches for texts that has already been processed by a previous scheme
-            if pre_handled_match and entire_match not in seen:
-                if pre_handled_match["tag"] not in scheme["tags"]:
-                    logger.warning(f"the dynamically returned '{pre_handled_match["tag"]}' is not included in: {scheme["tags"]}")
-                    continue
+    choice_encoder = ChoiceEncoder(max_len_tag_names, pane_labels)
+    screen_choices = choice_encoder.number(sorted_choices, 1)
 
-                seen.add(entire_match)
-                # We keep a copy of the original matched text for later
-                items.append((pre_handled_match,entire_match,match_start,))
-    # Clean up no longer needed variables
-    del seen
-    
-    if items == []:
-        logger.info('no link found')
-        return
+    # The history and the other panes, if requested, are scanned in the
+    # background and their links are appended to those of the screen while
+    # fzf is already running
+    history_batches:queue.Queue[list[str] | None] = queue.Queue()
+    stop_scanning = threading.Event()
+    history_thread:threading.Thread | None = None
 
-    # Sort items
-    sorted_choices = items
-    items.sort(key=lambda x: x[2],reverse=True)
+    def add_batch(items:ItemStore):
+        if not stop_scanning.is_set():
+            batch = choice_encoder.number(items, len(sorted_choices)+1)
+            sorted_choices.extend(items)
+            history_batches.put(batch)
 
-    # Find the maximum length in characters of the display text
-    max_len_tag_names:int = max([len(item[0]["tag"]) for item in items])
-        
-    # Number the items
-    numbered_choices = [f"{colors.index_color}{idx:4d}{colors.reset_color} {colors.dash_color}-{colors.reset_color} " \
-        f"{colors.tag_color}{('['+item[0]["tag"]+']').ljust(max_len_tag_names+2)}{colors.reset_color} {colors.dash_color}-{colors.reset_color} " \
-        # add 2 character because of `[` and `]` \
-        f"{item[0]["display_text"]}" for idx, item in enumerate(sorted_choices, 1)]
+    def scan_history():
+        try:
+            with tracer.stage("scan history"):
+                history_content, history_matches, history_hyperlinks = pane_cache.history(int(pane["history_size"]), int(pane["history_limit"]),
+                    lambda num_lines: capture_pane(f'-{num_lines}', '-1'))
+            with tracer.stage("save scan cache"):
+                pane_cache.save()
+            # The links of the history may be found through the index of the project
+            if project_index.enabled:
+                project_index.prepare(Path.cwd())
+            with tracer.stage("pre-handle history"):
+                history_items = collect_items(history_matches, schemes, seen, pre_handled, num_threads, stop_scanning,
+                    content=history_content, hyperlinks=history_hyperlinks if use_hyperlinks else None, pane_id=pane["pane_id"], budgets=budgets)
+            add_batch(history_items)
+        except Exception as e:
+            logger.error(f"error: failed to scan the pane history: {e}")
+
+    def scan_nearest_history():
+        # The history is captured and scanned in blocks moving back from the
+        # screen, until enough links are found; older lines are never captured
+        try:
+            history_size = int(pane["history_size"])
+            blocks = history_blocks(capture_pane, min(history_size, num_history_lines), history_size)
+            if project_index.enabled:
+                project_index.prepare(Path.cwd())
+            while len(sorted_choices) < num_nearest_links and not stop_scanning.is_set():
+                with tracer.stage("scan history"):
+                    block = next(blocks, None)
+                    if block is None:
+                        break
+                    content, hyperlinks = block
+                    matches = scanner.scan(content, 0, num_processes, budgets)
+                with tracer.stage("pre-handle history"):
+                    items = collect_items(matches, schemes, seen, pre_handled, num_threads, stop_scanning,
+                        content=content, hyperlinks=hyperlinks if use_hyperlinks else None, pane_id=pane["pane_id"], budgets=budgets)
+                add_batch(items)
+        except Exception as e:
+            logger.error(f"error: failed to scan the pane history: {e}")
+
+    # Held while `path_info_cache.base_dir` is set, which the previews and the scan of the other panes both do
+    base_dir_lock = threading.Lock()
+
+    def scan_other_pane(other_pane:dict[str,str], captured:str):
+        content, hyperlinks = parse_escape_sequences(captured)
+        matches = scanner.scan(content, budgets=budgets)
+        # Relative paths are resolved against the current path of the pane;
+        # links already found in other panes are listed again with their pane
+        if project_index.enabled:
+            project_index.prepare(Path(other_pane["pane_current_path"]))
+        with base_dir_lock:
+            path_info_cache.base_dir = Path(other_pane["pane_current_path"])
+            try:
+                items = collect_items(matches, schemes, set(), set(), num_threads, stop_scanning,
+                    content=content, hyperlinks=hyperlinks if use_hyperlinks else None, pane_id=other_pane["pane_id"], budgets=budgets)
+            finally:
+                path_info_cache.base_dir = None
+        add_batch(items)
+
+    def scan_in_background():
+        try:
+            # The other panes are captured concurrently while the history is scanned
+            captures = tmux.capture_panes([other_pane["pane_id"] for other_pane in other_panes],
+                f'-{num_history_lines}') if other_panes else iter(())
+            if num_history_lines and not num_nearest_links:
+                scan_history()
+            else:
+                with tracer.stage("save scan cache"):
+                    pane_cache.save()
+                if num_history_lines:
+                    scan_nearest_history()
+            with tracer.stage("scan other panes"):
+                for other_pane, (_, captured) in zip(other_panes, captures):
+                    if stop_scanning.is_set():
+                        break
+                    if captured is None:
+                        logger.debug(f"pane {other_pane["pane_id"]} could not be captured")
+                        continue
+                    scan_other_pane(other_pane, captured)
+        except Exception as e:
+            logger.error(f"error: failed to scan the other panes: {e}")
+        finally:
+            history_batches.put(None)
+
+    if num_history_lines or other_panes:
+        history_thread = threading.Thread(target=scan_in_background, daemon=True)
+        history_thread.start()
+        # Small histories are done almost immediately; waiting briefly lets the
+        # popup fit its content exactly, as when no streaming is needed
+        history_thread.join(timeout=HISTORY_SETTLE_TIMEOUT)
+    else:
+        with tracer.stage("save scan cache"):
+            pane_cache.save()
+        history_batches.put(None)
+
+    num_choices:int | None = None
+    if history_thread is None or not history_thread.is_alive():
+        if not sorted_choices:
+            logger.info('no link found')
+            return
+        num_choices = len(sorted_choices)
+
+    def choice_batches():
+        yield screen_choices
+        # The queue is polled so that the batches stop as soon as fzf exits,
+        # without waiting for the scan to produce its next batch
+        while not stop_scanning.is_set():
+            try:
+                batch = history_batches.get(timeout=BATCH_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if batch is None:
+                break
+            yield batch
+
+    # Previews are rendered by this process while fzf is running
+    preview_server:PreviewServer | None = None
+    if preview_str == 'on':
+        # Imported here: only needed when previews are enabled
+        from . import preview as preview_module
+        pane_dirs = {other_pane["pane_id"]: Path(other_pane["pane_current_path"]) for other_pane in other_panes}
+
+        def render_preview(idx:int) -> str | None:
+            item_idx = idx - 1
+            preview = sorted_choices.schemes[item_idx].get("preview")
+            if preview is None:
+                return None
+            # Paths are resolved against the current path of the pane of the link
+            with base_dir_lock:
+                path_info_cache.base_dir = pane_dirs.get(sorted_choices.pane_ids[item_idx])
+                try:
+                    return preview(sorted_choices.matches[item_idx])
+                finally:
+                    path_info_cache.base_dir = None
+
+        try:
+            # Items are numbered from 1; the schemes are the last column extended with new items
+            preview_server = preview_module.PreviewServer(render_preview, lambda: len(sorted_choices.schemes))
+            preview_server.start()
+        except OSError as e:
+            logger.warning(f"previews are not available: {e}")
+            if preview_server is not None:
+                preview_server.close()
+            preview_server = None
 
     # Run fzf and get selected items
     try:
         # Run fzf and get selected items
-        result = run_fzf(fzf_display_options,numbered_choices,colors.enabled)
+        from .fzf_handler import run_fzf
+        with tracer.stage("fzf"):
+            result = run_fzf(fzf_display_options,choice_batches(),colors.enabled,num_choices,
+                preview_server.command() if preview_server is not None else None, stop_scanning)
     except FzfError as e:
         logger.error(f"error: unexpected error: {e}")
         sys.exit(1)
     except FzfUserInterrupt as e:
         sys.exit(0)    
+    finally:
+        # Stop scanning as soon as the user has made a choice
+        stop_scanning.set()
+        if preview_server is not None:
+            preview_server.close()
+        # Paths are resolved against the pane of each selected link, which
+        # must not be changed meanwhile by the scan of the other panes
+        if other_panes and history_thread is not None:
+            history_thread.join()
+
+    if not sorted_choices:
+        logger.info('no link found')
+        return
 
     # Process selected items
     selected_choices = result.splitlines()
 
-    # Regular expression to parse the selected item from the fzf options
-    # Each line is in the format {four-digit number, two spaces <scheme type>, two spaces, <link>
-    selected_item_pattern = r"\s*(?P<idx>\d+)\s*-\s*\[(?P<type>.+?)\]\s*-\s*(?P<link>.+)"
+    # The openers of all selected items are started at once and waited for
+    # together; their errors are reported in a single message
+    launched:list[LaunchedOpener] = []
+    errors:list[str] = []
 
     # Process selected items
     for selected_choice in selected_choices:
-        match = re.match(selected_item_pattern, selected_choice)
-        if match:
-            idx_str:str = match.group("idx")
-            scheme_type:str = match.group("type")
-            
-            try:
-                idx:int=int(idx_str,10)
-                # pick the original item to be searched again
-                # before passing the `match` object to the post handler
-                selected_item=sorted_choices[idx-1][1]
-            except:
-                logger.error(f"error: malformed selection: {selected_choice}")
-                continue
-            
-            index_scheme = tag_to_index.get(scheme_type,None)
-            
-            if index_scheme is None:
-                logger.error(f"error: malformed selection: {selected_choice}")
-                continue
-
-            scheme=schemes[index_scheme]
+        # The hidden first field is the number of the item
+        idx_str, tab, _ = selected_choice.partition('\t')
+        if tab and idx_str.isdigit() and 0 < int(idx_str) <= len(sorted_choices):
+            # The original match is passed to the post handler as it is,
+            # without parsing the choice or searching the pattern again
+            item_idx = int(idx_str)-1
+            match = sorted_choices.matches[item_idx]
+            selected_pane_id = sorted_choices.pane_ids[item_idx]
+            scheme = sorted_choices.schemes[item_idx]
 
-            match=scheme["regex"].search(selected_item)
-            if match is None:
-                logger.error(f"error: pattern did not match unexpectedly")
-                continue          
-      
             # Get the post_handler, which applies after the user selection
             post_handler = scheme.get("post_handler",None)
 
-            # Process the match with the post handler
-            if post_handler:
-                post_handled_link = post_handler(match)    
-            else:
-                if scheme["opener"] == OpenerType.EDITOR:
-                    post_handled_link = {'file':match.group(0)}
-                elif scheme["opener"] == OpenerType.BROWSER:
-                    post_handled_link = {'url':match.group(0)}
+            # Process the match with the post handler, resolving paths
+            # against the current path of the pane in which it was found
+            if selected_pane_id != pane["pane_id"]:
+                path_info_cache.base_dir = Path(next(other_pane["pane_current_path"]
+                    for other_pane in other_panes if other_pane["pane_id"] == selected_pane_id))
+            try:
+                if post_handler:
+                    post_handled_link = post_handler(match)
                 else:
-                    raise MissingPostHandler(f"scheme with tags {scheme["tags"]} configured as custom opener but missing post handler")
+                    if scheme["opener"] == OpenerType.EDITOR:
+                        post_handled_link = {'file':match.group(0)}
+                    elif scheme["opener"] == OpenerType.BROWSER:
+                        post_handled_link = {'url':match.group(0)}
+                    else:
+                        raise MissingPostHandler(f"scheme with tags {scheme["tags"]} configured as custom opener but missing post handler")
+            except (FailedResolvePath, MissingPostHandler) as e:
+                # The other selected items are still opened
+                errors.append(f"{e}")
+                continue
+            except Exception as e:
+                errors.append(f"unexpected error: {e}")
+                continue
+            finally:
+                path_info_cache.base_dir = None
             try:
-                open_link(editor_open_cmd,browser_open_cmd,post_handled_link, schemes[index_scheme]["opener"])
+                with tracer.stage("open"):
+                    launched.append(launch_link(editor_open_cmd,browser_open_cmd,post_handled_link, scheme["opener"]))
             except (NoSuitableAppFound, PatternNotMatching, CommandFailed) as e:
-                logger.error(f"error: {e}")
+                errors.append(f"{e}")
                 continue
             except Exception as e:
-                logger.error(f"error: unexpected error: {e}")
+                errors.append(f"unexpected error: {e}")
                 continue
         else:
-            logger.error(f"error: malformed selection: {selected_choice}")
+            errors.append(f"malformed selection: {selected_choice}")
             continue
 
-if __name__ == "__main__":
+    with tracer.stage("open"):
+        errors.extend(wait_for_openers(launched))
+    if errors:
+        logger.error(f"error: {'; '.join(errors)}")
+
+def profile(capture_filename:str='', user_schemes_path:str='') -> int:
+    """Print what each scheme costs on a text captured from a pane, e.g. with `tmux capture-pane -p -S -`."""
+    if not capture_filename:
+        print("usage: python -m tmux_fzf_links profile CAPTURE_FILE [USER_SCHEMES_PATH]")
+        return 1
+    try:
+        with open(capture_filename, errors="replace") as f:
+            captured = f.read()
+        user_schemes, rm_default_schemes = load_user_module(user_schemes_path) if user_schemes_path else ([], [])
+    except (OSError, ImportError) as e:
+        print(f"error: {e}")
+        return 1
+    content, _ = parse_escape_sequences(captured)
+    # Imported here: only needed by the profile command
+    from .profiler import print_profile
+    return print_profile(merge_schemes(user_schemes, rm_default_schemes), content)
+
+def main(args:list[str] | None=None) -> int:
+    """Run the plugin with the positional arguments passed by the tmux key binding."""
+    if args is None:
+        args = sys.argv[1:]
+    if args[:1] == ["stats"]:
+        return print_stats()
+    if args[:1] == ["profile"]:
+        return profile(*args[1:])
+
+    status = 0
     try:
-        run(*sys.argv[1:])
+        run(*args)
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else 0
+        return status
     except KeyboardInterrupt:
         logging.info("script interrupted")
     except (FailedChDir,MissingPostHandler) as e:
         logging.error(f"{e}")
     except Exception as e:
         logging.error(f"unexpected runtime error: {e}")
+    finally:
+        tracer.finish(status)
+        # Display the pending log messages before returning
+        for handler in logging.getLogger().handlers:
+            handler.flush()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
 
 __all__ = []
\ No newline at end of file
@@ -0,0 +1,57 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+import math
+import logging
+import threading
+
+from .opener import SchemeEntry
+
+class SchemeBudgets:
+    """Time that each scheme may spend in its regex and pre_handler during a run.
+
+    A slow user scheme, e.g. a pattern backtracking on long lines or a
+    pre_handler querying the network, should not hold up the whole popup.
+    Neither a single regex search nor a single pre_handler call can be
+    interrupted, so the budget is checked between them: a scheme running out
+    of time keeps the links found so far and stops there, with one warning.
+    """
+
+    def __init__(self, budget:float=0.0):
+        # Seconds allowed to each scheme; zero for no limit
+        self.budget = budget
+        self._spent:dict[tuple[str,...],float] = {}
+        self._warned:set[tuple[str,...]] = set()
+        self._lock = threading.Lock()
+
+    def remaining(self, scheme:SchemeEntry) -> float:
+        """Return the seconds the scheme may still spend."""
+        if not self.budget:
+            return math.inf
+        return self.budget - self._spent.get(scheme["tags"], 0.0)
+
+    @property
+    def exceeded(self) -> bool:
+        """Whether any scheme ran out of its budget."""
+        return bool(self._warned)
+
+    def exhausted(self, scheme:SchemeEntry) -> bool:
+        return self.remaining(scheme) <= 0
+
+    def charge(self, scheme:SchemeEntry, seconds:float) -> bool:
+        """Charge time spent to the scheme; return whether it is still within its budget."""
+        if not self.budget:
+            return True
+        tags = scheme["tags"]
+        with self._lock:
+            spent = self._spent.get(tags, 0.0) + seconds
+            self._spent[tags] = spent
+            if spent <= self.budget:
+                return True
+            if tags not in self._warned:
+                self._warned.add(tags)
+                logging.warning(f"scheme {tags[0]} exceeded its time budget of {self.budget * 1000:g} ms; its remaining links are skipped")
+        return False
+
+__all__ = ["SchemeBudgets"]
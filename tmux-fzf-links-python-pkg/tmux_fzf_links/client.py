@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Thin client forwarding a key press to the resident server of the plugin.
+# This module is imported on every key press and must stay light: it only
+# depends on modules that are built into the interpreter, and on `runtime`.
+
+import os
+import sys
+import json
+import socket
+import subprocess
+import time
+from .runtime import private_runtime_dir, runtime_dir, tmux_server_id
+
+# Environment variables forwarded to the server with every request
+FORWARDED_ENV_VARS = ("TMUX", "PATH", "HOME", "LS_COLORS", "EDITOR", "BROWSER")
+
+# Maximum time waited for a newly started server to accept connections
+SERVER_START_TIMEOUT = 3.0
+SERVER_START_POLL_INTERVAL = 0.02
+# Maximum time waited for the server to take a request; a server busy with
+# another key press leaves the request to be served by the client itself
+SERVER_BUSY_TIMEOUT = 0.2
+# Sent by the server when it takes a request
+SERVER_READY = b"ready\n"
+
+def socket_path() -> str:
+    """Return the path of the socket of the server attached to the current tmux server."""
+    # One server per tmux server
+    return os.path.join(runtime_dir(), f"{tmux_server_id()}.sock")
+
+def send_request(path:str, request:bytes) -> int:
+    """Send a request to the server and return the exit status once it has been served.
+
+    Raise TimeoutError, without sending the request, if the server does not
+    take it within `SERVER_BUSY_TIMEOUT`.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(SERVER_BUSY_TIMEOUT)
+        client.connect(path)
+        if client.recv(len(SERVER_READY)) != SERVER_READY:
+            raise ValueError("unexpected greeting from the server")
+
+        # Serving the request lasts as long as the user takes to select a link
+        client.settimeout(None)
+        client.sendall(request)
+        client.shutdown(socket.SHUT_WR)
+
+        chunks:list[bytes] = []
+        while chunk := client.recv(4096):
+            chunks.append(chunk)
+
+    response = json.loads(b"".join(chunks))
+    return int(response.get("status", 0))
+
+def start_server(path:str) -> None:
+    """Start the server in the background, detached from the tmux job."""
+    _ = subprocess.Popen(
+        [sys.executable, "-m", "tmux_fzf_links.server", path],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+def main(args:list[str] | None=None) -> int:
+    """Forward the pane id and the positional arguments of the key binding to the server.
+
+    The server is started on demand. If it cannot be reached, or the runtime
+    directory is not private, the request is served by this process as in the
+    one-shot mode.
+    """
+    if args is None:
+        args = sys.argv[1:]
+    pane_id, run_args = (args[0], args[1:]) if args else ("", [])
+
+    env = {name: os.environ[name] for name in FORWARDED_ENV_VARS if name in os.environ}
+    if pane_id:
+        env["TMUX_PANE"] = pane_id
+    request = json.dumps({"args": run_args, "env": env}).encode()
+
+    path = socket_path()
+    try:
+        # Without a private runtime directory, the socket could be someone else's
+        _ = private_runtime_dir()
+        try:
+            return send_request(path, request)
+        except TimeoutError:
+            # The server is busy with another key press
+            raise
+        except (OSError, ValueError):
+            pass
+
+        start_server(path)
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while True:
+            try:
+                return send_request(path, request)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(SERVER_START_POLL_INTERVAL)
+    except (OSError, ValueError):
+        # Fall back to serving the request in this process
+        if pane_id:
+            os.environ["TMUX_PANE"] = pane_id
+        from .__main__ import main as run_main
+        return run_main(run_args)
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+__all__ = []
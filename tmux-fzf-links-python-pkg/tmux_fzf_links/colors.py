@@ -2,18 +2,90 @@
 #   Author: (c) 2024 Andrea Alberti
 #===============================================================================
 
+import os
+import stat
+import marshal
+import logging
+import tempfile
 from pathlib import Path
+from collections.abc import Callable
+from .runtime import private_runtime_dir
 from .errors_types import LsColorsNotConfigured
-import os
+from .pathinfo import path_info
 
 DEFAULT_TAG_COLOR = [130,130,130]
 DEFAULT_INDEX_COLOR = [0,255,0]
 DEFAULT_DASH_COLOR = [160,160,160]
 
+# File storing the last parsed LS_COLORS, so that it is not parsed again on every launch
+LS_COLORS_CACHE_FILENAME = "ls_colors.cache"
+# Bumped whenever the layout of the cache file changes
+LS_COLORS_CACHE_VERSION = 1
+
+# LS_COLORS keys of the file types decided by the mode of the file
+_FILE_TYPE_KEYS = {
+    stat.S_IFDIR: 'di',
+    stat.S_IFLNK: 'ln',
+    stat.S_IFIFO: 'pi',
+    stat.S_IFSOCK: 'so',
+    stat.S_IFBLK: 'bd',
+    stat.S_IFCHR: 'cd',
+}
+
+def parse_ls_colors(ls_colors:str) -> tuple[dict[str,str],dict[str,str]]:
+    """Parse LS_COLORS into the colors of the file types and those of the file name suffixes.
+
+    Suffixes (e.g. `*.tar.gz`) are lowercased, as `ls` matches them regardless of case.
+    """
+    type_colors:dict[str,str] = {}
+    suffix_colors:dict[str,str] = {}
+    for item in ls_colors.split(':'):
+        key, sep, value = item.partition('=')
+        if not sep:
+            continue
+        if key.startswith('*'):
+            suffix_colors[key[1:].lower()] = value
+        else:
+            type_colors[key] = value
+    return type_colors, suffix_colors
+
+def _ls_colors_cache_path() -> str:
+    return os.path.join(private_runtime_dir(), LS_COLORS_CACHE_FILENAME)
+
+def _read_ls_colors_cache(key:str) -> tuple[dict[str,str],dict[str,str]] | None:
+    try:
+        with open(_ls_colors_cache_path(), "rb") as f:
+            data = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(data, tuple) or len(data) != 4 or data[:2] != (LS_COLORS_CACHE_VERSION, key): # pyright: ignore[reportUnknownArgumentType]
+        return None
+    return data[2], data[3] # pyright: ignore[reportUnknownVariableType]
+
+def _write_ls_colors_cache(key:str, type_colors:dict[str,str], suffix_colors:dict[str,str]) -> None:
+    try:
+        path = _ls_colors_cache_path()
+        directory = os.path.dirname(path)
+        # Written to a temporary file first so that a concurrent reader never sees a partial file
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                marshal.dump((LS_COLORS_CACHE_VERSION, key, type_colors, suffix_colors), f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError as e:
+        logging.debug(f"LS_COLORS cache could not be written: {e}")
+
 class ColorsSingletonCls:
     _instance = None
 
-    _color_mapping:dict[str,str] = {} # dictionary storing LS_COLORS
+    _type_colors:dict[str,str] = {} # colors of the file types, e.g. `di` for directories
+    _suffix_colors:dict[str,str] = {} # colors of the lowercase file name suffixes, e.g. `.tar.gz`
+    _suffix_lengths:list[int] = [] # lengths of the suffixes, longest first
+    _file_colors:dict[str,str] = {} # colors already determined, keyed by path
+    _ls_colors_key:str | None = None # key of the LS_COLORS parsed into the tables above
     enabled:bool = False # whether to use colors
     tag_color:str = ""  # fallback case
     index_color:str = ""  # fallback case
@@ -56,76 +128,118 @@ class ColorsSingletonCls:
         else:
             return ""
 
-    def configure_ls_colors_from_str(self,ls_colors:str):
-        """Parse the LS_COLORS into a dictionary."""
+    def _configure(self, key:str, read_ls_colors:Callable[[],str]) -> None:
+        """Load the tables of the LS_COLORS identified by `key`, parsing it only when not cached on disk."""
+        # Nothing to do if the same LS_COLORS was already loaded
+        if key == self._ls_colors_key:
+            return
+
+        tables = _read_ls_colors_cache(key)
+        if tables is None:
+            tables = parse_ls_colors(read_ls_colors())
+            _write_ls_colors_cache(key, *tables)
 
-        for item in ls_colors.split(':'):
-            if '=' in item:
-                key, value = item.split('=')
-                self._color_mapping[key] = value
+        self._type_colors, self._suffix_colors = tables
+        self._suffix_lengths = sorted({len(suffix) for suffix in self._suffix_colors}, reverse=True)
+        self._file_colors = {}
+        self._ls_colors_key = key
+
+    def configure_ls_colors_from_str(self,ls_colors:str):
+        """Configure the colors from an LS_COLORS string."""
+        # The string itself is the key, compared in full when the cache is read
+        key = f"str:{ls_colors}"
+        self._configure(key, lambda: ls_colors)
 
     def configure_ls_colors_from_file(self,ls_colors_filename:str):
         try:
-            with open(ls_colors_filename, 'r') as file:
-                ls_colors = file.read().strip()
+            file_stat = os.stat(ls_colors_filename)
         except FileNotFoundError:
             raise LsColorsNotConfigured(f"file '{ls_colors_filename}' not found; LS_COLORS cannot be configured")
 
-        self.configure_ls_colors_from_str(ls_colors)
+        def read_ls_colors() -> str:
+            with open(ls_colors_filename, 'r') as file:
+                return file.read().strip()
+
+        # The file is only read when it has changed
+        key = f"file:{os.path.realpath(ls_colors_filename)}:{file_stat.st_mtime_ns}:{file_stat.st_size}"
+        self._configure(key, read_ls_colors)
         
     def configure_ls_colors_from_env(self):
         ls_colors = os.getenv('LS_COLORS', None)
         if ls_colors:
             self.configure_ls_colors_from_str(ls_colors)
 
+    def clear_file_colors(self) -> None:
+        """Forget the colors already determined; needed whenever the current directory changes."""
+        self._file_colors = {}
+
+    def _suffix_color(self, file_name:str) -> str | None:
+        """Return the color of the longest suffix of the file name found in LS_COLORS."""
+        file_name = file_name.lower()
+        for length in self._suffix_lengths:
+            if length <= len(file_name):
+                color = self._suffix_colors.get(file_name[-length:])
+                if color is not None:
+                    return color
+        return None
+
+    def _classify(self, filepath:Path) -> str:
+        # Decide the file type from a single (cached) stat
+        info = path_info(filepath)
+        type_colors = self._type_colors
+
+        if info.lstat is None:
+            return type_colors.get('mi', "")  # Missing file
+
+        mode = info.lstat.st_mode
+        if stat.S_ISLNK(mode):
+            if info.stat is None:
+                return type_colors.get('or', type_colors.get('ln', ""))  # Orphan symbolic link
+            if type_colors.get('ln') != 'target':
+                return type_colors.get('ln', "")  # Symbolic link
+            # With `ln=target`, links are colored as the file they point to
+            mode = info.stat.st_mode
+
+        if stat.S_ISREG(mode):
+            if mode & stat.S_ISUID and 'su' in type_colors:
+                return type_colors['su']  # Setuid file
+            if mode & stat.S_ISGID and 'sg' in type_colors:
+                return type_colors['sg']  # Setgid file
+            if mode & 0o111 and 'ex' in type_colors:
+                return type_colors['ex']  # Executable file
+            if info.lstat.st_nlink > 1 and 'mh' in type_colors:
+                return type_colors['mh']  # Multi-hard link
+            color = self._suffix_color(filepath.name)
+            if color is not None:
+                return color
+            return type_colors.get('fi', "")  # Regular file
+
+        if stat.S_ISDIR(mode):
+            if mode & stat.S_ISVTX and mode & stat.S_IWOTH and 'tw' in type_colors:
+                return type_colors['tw']  # Sticky and other-writable directory
+            if mode & stat.S_IWOTH and 'ow' in type_colors:
+                return type_colors['ow']  # Other-writable directory
+            if mode & stat.S_ISVTX and 'st' in type_colors:
+                return type_colors['st']  # Sticky directory
+
+        # Directories, pipes, sockets and devices
+        return type_colors.get(_FILE_TYPE_KEYS.get(stat.S_IFMT(mode), ''), "")
+
     def get_file_color(self,filepath: Path) -> str:
         """Determine the color for a given file based on LS_COLORS.
         
         Return an empty string as the fallback case when no color code is found for filepath.
+        The file type and the longest matching suffix are classified as `ls` does.
         """
-        if not self._color_mapping:
+        if not self._type_colors and not self._suffix_colors:
             return ""
 
-        # Handle specific file types
-        if filepath.is_dir():
-            return self._color_mapping.get('di', "")  # Directory
-        elif filepath.is_symlink():
-            return self._color_mapping.get('ln', "")  # Symbolic link
-        elif filepath.is_block_device():
-            return self._color_mapping.get('bd', "")  # Block device
-        elif filepath.is_char_device():
-            return self._color_mapping.get('cd', "")  # Character device
-        elif filepath.is_fifo():
-            return self._color_mapping.get('pi', "")  # Named pipe (FIFO)
-        elif filepath.is_socket():
-            return self._color_mapping.get('so', "")  # Socket
-        elif filepath.is_file() and os.access(filepath, os.X_OK):
-            return self._color_mapping.get('ex', "")  # Executable file
-
-        # Check for file extension mapping
-        ext = filepath.suffix  # Extract the file extension (e.g., '.txt')
-        if ext:
-            ext_key = f"*{ext}"  # Convert '.txt' to '*.txt'
-            if ext_key in self._color_mapping:
-                return self._color_mapping[ext_key]
-
-        # Handle additional cases based on LS_COLORS
-        file_name = filepath.name
-        if file_name.startswith('.'):
-            return self._color_mapping.get('mh', "")  # Multi-hard link
-        elif file_name.endswith('~'):
-            return self._color_mapping.get('ow', "")  # Other writable file
-        elif not filepath.exists():
-            return self._color_mapping.get('mi', "")  # Missing file
-        elif filepath.is_symlink() and not filepath.exists():
-            return self._color_mapping.get('or', "")  # Orphan symbolic link
-        elif filepath.is_symlink() and filepath.is_dir():
-            return self._color_mapping.get('tw', "")  # Sticky and other-writable dir
-        elif filepath.is_file():
-            return self._color_mapping.get('fi', "")  # Regular file
-
-        # Fallback strategy for unknown types
-        return ""
+        key = str(filepath)
+        color = self._file_colors.get(key)
+        if color is None:
+            color = self._classify(filepath)
+            self._file_colors[key] = color
+        return color
 
 # Instantiate the singleton class
 colors = ColorsSingletonCls()
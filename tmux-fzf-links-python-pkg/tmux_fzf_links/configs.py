@@ -22,7 +22,17 @@ class ConfigsCls:
             log_filename:str,
             user_schemes_path:str,
             use_ls_colors_str:str,
-            ls_colors_filename:str
+            ls_colors_filename:str,
+            pre_handler_threads:str,
+            scan_cache_str:str,
+            trace_str:str,
+            hyperlinks_str:str,
+            scope_str:str,
+            scan_processes_str:str,
+            nearest_links_str:str,
+            project_index_str:str,
+            scheme_time_budget_str:str,
+            preview_str:str
         ):      
 
         self.history_limit = history_lines
@@ -36,6 +46,16 @@ class ConfigsCls:
         self.user_schemes_path = user_schemes_path
         self.use_ls_colors_str = use_ls_colors_str
         self.ls_colors_filename = ls_colors_filename
+        self.pre_handler_threads = pre_handler_threads
+        self.scan_cache_str = scan_cache_str
+        self.trace_str = trace_str
+        self.hyperlinks_str = hyperlinks_str
+        self.scope_str = scope_str
+        self.scan_processes_str = scan_processes_str
+        self.nearest_links_str = nearest_links_str
+        self.project_index_str = project_index_str
+        self.scheme_time_budget_str = scheme_time_budget_str
+        self.preview_str = preview_str
 
 # Instantiate the singleton class
 configs = ConfigsCls()
@@ -5,7 +5,8 @@
 import re
 import sys
 import shlex
-from .export import OpenerType, SchemeEntry, PreHandledMatch, colors, heuristic_find_file, configs
+from pathlib import Path
+from .export import OpenerType, SchemeEntry, PreHandledMatch, colors, heuristic_find_file, lazy_compile, configs, path_info
 from .errors_types import NotSupportedPlatform, FailedResolvePath
 
 # >>> GIT SCHEME >>>
@@ -21,15 +22,20 @@ def git_post_handler(match:re.Match[str]) -> dict[str,str]:
 
     return {'url': f"https://{server}/{repo}"}
 
+def git_preview(match:re.Match[str]) -> str:
+    remote = match.group(0).removeprefix("ssh://")
+    return f"remote: {remote}\nserver: {match.group("server")}\nrepository: {match.group("repo")}\nweb: {git_post_handler(match)['url']}"
+
 git_scheme:SchemeEntry = {
         "tags": ("git",),
         "opener":OpenerType.BROWSER,
         "post_handler": git_post_handler,
+        "preview": git_preview,
         "pre_handler": lambda m: {
             "display_text": f"{colors.rgb_color(0,255,115)}{m.group(0)}{colors.reset_color}",
             "tag": "git"
         },
-        "regex": re.compile(r"(ssh://)?git@(?P<server>[^ \t\n\"\'\)\]\}]+)\:(?P<repo>[^ \t\n\"\'\)\]\}]+)")
+        "regex": lazy_compile(r"(ssh://)?git@(?P<server>[^ \t\n\"\'\)\]\}]+)\:(?P<repo>[^ \t\n\"\'\)\]\}]+)")
     }
 
 # <<< GIT SCHEME <<<
@@ -73,14 +79,24 @@ def code_error_post_handler(match:re.Match[str]) -> dict[str,str]:
 
     line=match.group('line')
 
-    return {'file':str(resolved_path.resolve()), 'line':line}
+    return {'file':str(path_info(resolved_path).resolve()), 'line':line}
+
+def code_error_preview(match:re.Match[str]) -> str | None:
+    # Source lines around the reported line
+    resolved_path = heuristic_find_file(match.group('file'))
+    if resolved_path is None:
+        return None
+    # Imported here: previews are only rendered when enabled, while fzf is running
+    from .preview import source_excerpt
+    return f"{resolved_path}\n\n{source_excerpt(resolved_path, int(match.group('line')))}"
 
 code_error_scheme:SchemeEntry = {
             "tags": ("code err.","Python"),
             "opener": OpenerType.EDITOR,
             "post_handler": code_error_post_handler,
+            "preview": code_error_preview,
             "pre_handler": code_error_pre_handler,
-            "regex": re.compile(r"File \"(?P<file>...*?)\"\, line (?P<line>[0-9]+)")
+            "regex": lazy_compile(r"File \"(?P<file>...*?)\"\, line (?P<line>[0-9]+)")
         }
 
 # <<< CODE ERROR SCHEME <<<
@@ -95,7 +111,7 @@ url_scheme:SchemeEntry = {
             "display_text": f"{colors.rgb_color(200,0,255)}{m.group(0)}{colors.reset_color}",
             "tag": "url"
         },
-        "regex": re.compile(r"https?://(?:www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b[-a-zA-Z0-9()@:%_\+.~#?&//=]*")
+        "regex": lazy_compile(r"https?://(?:www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b[-a-zA-Z0-9()@:%_\+.~#?&//=]*")
     }
 
 # <<< URL SCHEME <<<
@@ -114,7 +130,7 @@ def file_pre_handler(match: re.Match[str]) -> PreHandledMatch | None:
     resolved_path = heuristic_find_file(file_path_str)
     
     if resolved_path:
-        tag="dir" if resolved_path.is_dir() else "file"
+        tag="dir" if path_info(resolved_path).is_dir() else "file"
         if colors.enabled:
             color_code=colors.get_file_color(resolved_path)
             display_text = f"\033[{color_code}m{str(resolved_path)}\033[0m"
@@ -127,19 +143,13 @@ def file_pre_handler(match: re.Match[str]) -> PreHandledMatch | None:
     else:
         return None
 
-def file_post_handler(match:re.Match[str]) -> list[str]:
-
-    # Get the matched file path
-    file_path_str = match.group("link1") or match.group("link2")
-
-    resolved_path = heuristic_find_file(file_path_str)
-    if resolved_path is None:
-        raise FailedResolvePath(f"could not resolve the path of: {file_path_str}")
-
-    resolved_path_str = str(resolved_path.resolve())
+def file_opener_args(resolved_path:Path) -> list[str]:
+    """Return the command opening a file in the editor, or with the default app when it is binary."""
+    resolved_path_info = path_info(resolved_path)
+    resolved_path_str = str(resolved_path_info.resolve())
 
     is_binary=True # we assume a binary file as the fallback case
-    if resolved_path.is_file():
+    if resolved_path_info.is_file():
         # Open the file in binary mode and read a portion of it
         with resolved_path.open('rb') as file:
             chunk = file.read(1024)  # Read the first 1024 bytes
@@ -159,22 +169,111 @@ def file_post_handler(match:re.Match[str]) -> list[str]:
         args = shlex.split(configs.editor_open_cmd.replace(f"%file",resolved_path_str).replace(f"%line","1"))
         return args
 
+def file_post_handler(match:re.Match[str]) -> list[str]:
+
+    # Get the matched file path
+    file_path_str = match.group("link1") or match.group("link2")
+
+    resolved_path = heuristic_find_file(file_path_str)
+    if resolved_path is None:
+        raise FailedResolvePath(f"could not resolve the path of: {file_path_str}")
+
+    return file_opener_args(resolved_path)
+
+def file_preview(match:re.Match[str]) -> str | None:
+    # Head of a file, or the entries of a directory
+    resolved_path = heuristic_find_file(match.group("link1") or match.group("link2"))
+    if resolved_path is None:
+        return None
+    # Imported here: previews are only rendered when enabled, while fzf is running
+    from .preview import dir_listing, file_head
+    if path_info(resolved_path).is_dir():
+        return dir_listing(resolved_path)
+    return file_head(resolved_path)
+
 file_scheme:SchemeEntry = {
         "tags": ("file","dir"),
         "opener": OpenerType.CUSTOM,
         "post_handler": file_post_handler,
+        "preview": file_preview,
         "pre_handler": file_pre_handler,
-        "regex": re.compile(r"(\'(?P<link1>\~?[a-zA-Z0-9_\/\-\:\. ]+)\'|(?P<link2>\~?[a-zA-Z0-9_\/\-\:\.]+))")
+        "regex": lazy_compile(r"(\'(?P<link1>\~?[a-zA-Z0-9_\/\-\:\. ]+)\'|(?P<link2>\~?[a-zA-Z0-9_\/\-\:\.]+))")
     }
 
 # <<< FILE SCHEME <<<
 
-# Define schemes
+# >>> HYPERLINK SCHEME >>>
+
+# Hyperlinks are not searched in the text: the terminal marks them with OSC 8
+# escape sequences, which are found while capturing the pane. Each one is
+# matched as `<target>\x1f<text>` with the regex of this scheme.
+
+def hyperlink_pre_handler(match:re.Match[str]) -> PreHandledMatch | None:
+    url = match.group("url")
+    # A link broken over several lines is shown on a single line
+    text = ' '.join(match.group("text").split())
+    if not url:
+        return None
+
+    display_text = url if text in ("", url) else f"{text} ({url})"
+    return {
+        "display_text": f"{colors.rgb_color(200,0,255)}{display_text}{colors.reset_color}",
+        "tag": "link"
+    }
+
+def hyperlink_post_handler(match:re.Match[str]) -> list[str]:
+    url = match.group("url")
+
+    # Local files are opened like those of the file scheme
+    if url.startswith("file://"):
+        # Imported here: only needed to open a link, after fzf has returned
+        from urllib.parse import unquote, urlsplit
+        resolved_path = Path(unquote(urlsplit(url).path))
+        if not path_info(resolved_path).exists():
+            raise FailedResolvePath(f"could not resolve the path of: {url}")
+        return file_opener_args(resolved_path)
+
+    if configs.browser_open_cmd:
+        return shlex.split(configs.browser_open_cmd.replace("%url",url))
+    elif sys.platform == "darwin":
+        return ['open', url]
+    elif sys.platform == "linux":
+        return ['xdg-open', url]
+    elif sys.platform == "win32":
+        return ['explorer', url]
+    else:
+        raise NotSupportedPlatform(f"platform {sys.platform} not supported")
+
+def hyperlink_preview(match:re.Match[str]) -> str | None:
+    # Local files are previewed like those of the file scheme
+    url = match.group("url")
+    if not url.startswith("file://"):
+        return None
+    from urllib.parse import unquote, urlsplit
+    from .preview import dir_listing, file_head
+    resolved_path = Path(unquote(urlsplit(url).path))
+    if path_info(resolved_path).is_dir():
+        return dir_listing(resolved_path)
+    return file_head(resolved_path)
+
+hyperlink_scheme:SchemeEntry = {
+        "tags": ("link",),
+        "opener": OpenerType.CUSTOM,
+        "post_handler": hyperlink_post_handler,
+        "preview": hyperlink_preview,
+        "pre_handler": hyperlink_pre_handler,
+        "regex": lazy_compile(r"(?P<url>[^\x1f]*)\x1f(?P<text>.*)", re.DOTALL)
+    }
+
+# <<< HYPERLINK SCHEME <<<
+
+# Define schemes in order of precedence; the broad file scheme comes last so
+# that it does not claim pieces of the links matched by the other schemes
 default_schemes: list[SchemeEntry] = [
         url_scheme,
-        file_scheme,
         git_scheme,
-        code_error_scheme
+        code_error_scheme,
+        file_scheme
     ]
 
-__all__ = ["default_schemes"]
+__all__ = ["default_schemes", "hyperlink_scheme"]
@@ -0,0 +1,75 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+import re
+
+# Hyperlink found in the text: start and end offsets of its text, and its target
+Hyperlink = tuple[int,int,str]
+
+# Every class of escape sequence that a terminal may leave in a capture
+_ESCAPE_SEQUENCE = re.compile(
+    r"\x1b(?:"
+    r"\[[0-?]*[ -/]*[@-~]"              # CSI, e.g. SGR colors and erase in line
+    r"|\][^\x07\x1b]*(?:\x07|\x1b\\)?"  # OSC, terminated by BEL or ST, e.g. OSC 8 hyperlinks
+    r"|[PX^_][^\x1b]*(?:\x1b\\)?"       # DCS, SOS, PM and APC strings
+    r"|[ -/]*[0-~]"                     # other sequences, e.g. charset selection
+    r")?"                               # a lone ESC is dropped too
+)
+
+# Prefix of the OSC 8 sequences, `ESC ] 8 ; params ; URI ST`, which open a
+# hyperlink, or close it when the URI is empty
+_OSC8_PREFIX = "\x1b]8;"
+
+def _osc8_target(sequence:str) -> str:
+    body = sequence[len(_OSC8_PREFIX):].rstrip("\x07").removesuffix("\x1b\\")
+    return body.partition(";")[2]
+
+def parse_escape_sequences(text:str) -> tuple[str,list[Hyperlink]]:
+    """Remove all escape sequences from `text` in a single pass.
+
+    Return the plain text and the OSC 8 hyperlinks it contains, with the
+    offsets of their text in the plain text.
+    """
+    if "\x1b" not in text:
+        return text, []
+    if _OSC8_PREFIX not in text:
+        return _ESCAPE_SEQUENCE.sub("", text), []
+
+    pieces:list[str] = []
+    hyperlinks:list[Hyperlink] = []
+    # Length of the plain text produced so far
+    length = 0
+    last = 0
+    # Start and target of the hyperlink being read
+    open_start = 0
+    open_target = ""
+
+    for escape in _ESCAPE_SEQUENCE.finditer(text):
+        start = escape.start()
+        if start > last:
+            pieces.append(text[last:start])
+            length += start - last
+        last = escape.end()
+
+        sequence = escape.group()
+        if not sequence.startswith(_OSC8_PREFIX):
+            continue
+        target = _osc8_target(sequence)
+        if target == open_target:
+            # Reopened, e.g. after a change of colors within the link
+            continue
+        if open_target and length > open_start:
+            hyperlinks.append((open_start, length, open_target))
+        open_start = length
+        open_target = target
+
+    if last < len(text):
+        pieces.append(text[last:])
+        length += len(text) - last
+    if open_target and length > open_start:
+        hyperlinks.append((open_start, length, open_target))
+
+    return "".join(pieces), hyperlinks
+
+__all__ = ["Hyperlink", "parse_escape_sequences"]
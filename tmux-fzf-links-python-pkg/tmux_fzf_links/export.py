@@ -3,8 +3,24 @@
 #===============================================================================
 
 from .opener import OpenerType, SchemeEntry, PreHandledMatch
-from .schemes import heuristic_find_file
+from .schemes import heuristic_find_file, lazy_compile
+from .pathinfo import PathInfo, path_info
 from .configs import configs
 from .colors import colors
+from typing import TYPE_CHECKING, Any
 
-__all__ = ["OpenerType", "SchemeEntry", "colors", "configs", "heuristic_find_file", "PreHandledMatch"]
+if TYPE_CHECKING:
+    from .preview import dir_listing, file_head, source_excerpt
+
+# Helpers of the preview module, imported on first use: the module pulls in
+# the socket and thread machinery of the preview server, which most runs
+# never start
+_PREVIEW_HELPERS = ("dir_listing", "file_head", "source_excerpt")
+
+def __getattr__(name:str) -> Any:
+    if name in _PREVIEW_HELPERS:
+        from . import preview
+        return getattr(preview, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+__all__ = ["OpenerType", "SchemeEntry", "colors", "configs", "heuristic_find_file", "lazy_compile", "PreHandledMatch", "PathInfo", "path_info", "dir_listing", "file_head", "source_excerpt"]
@@ -4,11 +4,22 @@
 
 import shlex
 from .errors_types import FailedTmuxPaneSize, FzfError, FzfUserInterrupt
-import subprocess
+from collections.abc import Iterable
+from .tmux import tmux
+from .tracing import tracer
 import logging
 import tempfile
+import threading
+import subprocess
+import errno
 import os
 
+# Interval at which the named pipes are checked while waiting for fzf to open them
+FIFO_OPEN_POLL_INTERVAL = 0.005
+
+# Time given to the writer of the choices to finish once fzf has exited
+WRITER_JOIN_TIMEOUT = 0.5
+
 def extract_option(cmd_user_args:list[str],option:str) -> str | None:
     # extract the user option
 
@@ -41,8 +52,62 @@ def parse_int_option(option_arg:str|None,ref_value:int|None) -> int|None:
     return int_value
 
 
-def run_fzf(fzf_display_options: str, choices: list[str], use_ls_colors: bool) -> str:
-    """Run fzf within a tmux popup with the given options and handle output via mkfifo."""
+def write_choices(choices_pipe:str, choice_batches:Iterable[list[str]], stop:threading.Event) -> None:
+    """Stream batches of choices into the named pipe read by fzf, one choice per line.
+
+    Each batch reaches fzf as soon as it is written. Writing stops as soon as
+    fzf exits, e.g. because the user already made a selection or canceled it,
+    and never starts if `stop` is set before fzf opens the pipe, e.g. because
+    the popup failed.
+    """
+    # Opening without blocking fails until fzf opens the other end of the pipe
+    while True:
+        try:
+            fd = os.open(choices_pipe, os.O_WRONLY | os.O_NONBLOCK)
+            break
+        except OSError as e:
+            if e.errno != errno.ENXIO:
+                raise
+        if stop.wait(FIFO_OPEN_POLL_INTERVAL):
+            logging.debug("fzf exited before opening its input")
+            return
+    os.set_blocking(fd, True)
+
+    try:
+        with open(fd, 'w') as choices_file:
+            for batch in choice_batches:
+                if batch:
+                    _ = choices_file.write('\n'.join(batch) + '\n')
+                    choices_file.flush()
+    except BrokenPipeError:
+        logging.debug("fzf closed its input before all choices were written")
+
+def release_outputs(tmux_process:subprocess.Popen[bytes], output_pipes:list[str], opened:threading.Event, exited:threading.Event) -> None:
+    """Wait for the popup to exit, set `exited`, then release the reader of the named pipes that fzf never opened.
+
+    Opening a named pipe for reading blocks until it is opened for writing;
+    opening and closing it here lets the reader find it empty instead.
+    """
+    _ = tmux_process.wait()
+    exited.set()
+    while not opened.is_set():
+        for pipe in output_pipes:
+            try:
+                os.close(os.open(pipe, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                # Nobody is waiting to read this pipe
+                pass
+        _ = opened.wait(FIFO_OPEN_POLL_INTERVAL)
+
+def run_fzf(fzf_display_options: str, choice_batches: Iterable[list[str]], use_ls_colors: bool, num_choices: int | None = None, preview_command: str | None = None, exited: threading.Event | None = None) -> str:
+    """Run fzf within a tmux popup with the given options and handle output via mkfifo.
+
+    The choices are streamed to fzf in batches while they are produced. When
+    their number is known in advance, `num_choices` lets the popup fit them exactly.
+    The `preview_command` overrides any preview given in the options, including `--no-preview`.
+    The `exited` event is set as soon as the popup exits, so that the producer
+    of the choices can stop without waiting for the selection to be read.
+    """
 
     # Parse user options into a list
     cmd_user_args: list[str] = shlex.split(fzf_display_options)
@@ -50,20 +115,15 @@ def run_fzf(fzf_display_options: str, choices: list[str], use_ls_colors: bool) -
     VER_BORDER = 4 # number of characters taken by vertical border
     HOR_BORDER = 2 # number of characters taken by horizontal border
 
-    # Command to launch tmux popup
-    tmux_popup_command:list[str] = [
-        "tmux", "popup",
+    # Options of the tmux popup
+    tmux_popup_options:list[str] = [
         "-E",  # Ensure the command runs interactively
     ]
 
     # Retrieve the current pane size
     try:
-        pane_size_str:str = subprocess.check_output(
-            ('tmux', 'display', '-p', '#{pane_height},#{pane_width}',),
-            shell=False,
-            text=True,
-        )
-        pane_height, pane_width = map(int, pane_size_str.split(','))
+        pane = tmux.pane()
+        pane_height, pane_width = int(pane["pane_height"]), int(pane["pane_width"])
     except Exception as e:
         raise FailedTmuxPaneSize(f"tmux pane size could not be determined: {e}")
 
@@ -74,7 +134,7 @@ def run_fzf(fzf_display_options: str, choices: list[str], use_ls_colors: bool) -
     except (IndexError, ValueError):
         raise FailedTmuxPaneSize("option '-x' is defined but its value is missing or invalid")
     if x:
-        tmux_popup_command.extend(["-x", f"{x}"])
+        tmux_popup_options.extend(["-x", f"{x}"])
 
     # Set the y offset of the popup
     try:
@@ -83,7 +143,7 @@ def run_fzf(fzf_display_options: str, choices: list[str], use_ls_colors: bool) -
     except (IndexError, ValueError):
         raise FailedTmuxPaneSize("option '-y' is defined but its value is missing or invalid")
     if y:
-        tmux_popup_command.extend(["-y", f"{y}"])
+        tmux_popup_options.extend(["-y", f"{y}"])
 
     # Set the width of the popup
     try:
@@ -97,7 +157,7 @@ def run_fzf(fzf_display_options: str, choices: list[str], use_ls_colors: bool) -
 
         # Adjust width for the fzf border
         fzf_width = min(width + HOR_BORDER,pane_width)
-        tmux_popup_command.extend(["-w", f"{fzf_width}"])
+        tmux_popup_options.extend(["-w", f"{fzf_width}"])
 
     # Get the height of the popup
     try:
@@ -109,10 +169,13 @@ def run_fzf(fzf_display_options: str, choices: list[str], use_ls_colors: bool) -
     if height:
         # Force at least one line
         height = max(height,1)
-    else:
+    elif num_choices is not None:
         # If height is not specified in the options, the plugin dynamically
         # computes the necessary popup height to fit all items
-        height = len(choices)  # Number of lines
+        height = num_choices  # Number of lines
+    else:
+        # The choices are still being produced; take as much room as allowed
+        height = pane_height-VER_BORDER
 
     # Get the maximum number of matches to be displayed at once
     try:
@@ -125,60 +188,83 @@ def run_fzf(fzf_display_options: str, choices: list[str], use_ls_colors: bool) -
 
     # Adjust height for the fzf border
     fzf_height = min(height + VER_BORDER,pane_height)
-    tmux_popup_command.extend(["-h", f"{fzf_height}"])
+    tmux_popup_options.extend(["-h", f"{fzf_height}"])
 
-    # Base fzf arguments
-    fzf_args = ['--no-sort']
+    # Base fzf arguments; the first field of each choice identifies the item
+    # and is hidden, but returned with the selection
+    fzf_args = ['--no-sort', '--delimiter', '\t', '--with-nth', '2..']
     if use_ls_colors:
         fzf_args.append('--ansi')
 
     logging.debug(f"fzf_args: {fzf_args}")
-    logging.debug(f"tmux_popup_command: {tmux_popup_command}")
+    logging.debug(f"tmux_popup_options: {tmux_popup_options}")
     logging.debug(f"cmd_user_args: {cmd_user_args}")
 
     # Combine fzf arguments, giving user options higher priority
     cmd_args = fzf_args + cmd_user_args
+    if preview_command:
+        cmd_args.extend(['--preview', preview_command])
 
     # Create a temporary directory for the named pipes
     with tempfile.TemporaryDirectory() as tmpdir:
         logging.debug(f"TMP {tmpdir}")
         # Paths for the named pipes
+        stdin_pipe = os.path.join(tmpdir, 'fzf_stdin')
         stdout_pipe = os.path.join(tmpdir, 'fzf_stdout')
         stderr_pipe = os.path.join(tmpdir, 'fzf_stderr')
 
-        # Create named pipes for stdout and stderr
+        # Create named pipes for stdin, stdout, and stderr
+        os.mkfifo(stdin_pipe)
         os.mkfifo(stdout_pipe)
         os.mkfifo(stderr_pipe)
 
-        # Choices → [stdin] → fzf (interactive UI on /dev/tty)
+        # Choices → Named Pipe (stdin_pipe) → [stdin] → fzf (interactive UI on /dev/tty)
         #           → [stdout] → Named Pipe (stdout_pipe)
         #           → [stderr] → Named Pipe (stderr_pipe)
         
         # Prepare the fzf command to run inside the tmux popup
         fzf_command = (
-            f"echo -e \"{chr(10).join(choices)}\" | "
             f"fzf {' '.join(shlex.quote(arg) for arg in cmd_args)} "
-            f"> {shlex.quote(stdout_pipe)} 2> {shlex.quote(stderr_pipe)}"
+            f"< {shlex.quote(stdin_pipe)} > {shlex.quote(stdout_pipe)} 2> {shlex.quote(stderr_pipe)}"
         )
 
-        tmux_popup_command.append(fzf_command)
-
+        # Set once fzf has exited, and once the named pipes of its outputs are open
+        stop = threading.Event() if exited is None else exited
+        opened = threading.Event()
         try:
             # Start the tmux popup process
-            tmux_process = subprocess.Popen(tmux_popup_command, shell=False)
+            with tracer.stage("popup launch"):
+                tmux_process = tmux.popup(tmux_popup_options, fzf_command)
+
+            # Feed the choices to fzf in the background while it is already interactive
+            writer = threading.Thread(target=write_choices, args=(stdin_pipe, choice_batches, stop), daemon=True)
+            writer.start()
+            releaser = threading.Thread(target=release_outputs, args=(tmux_process, [stdout_pipe, stderr_pipe], opened, stop), daemon=True)
+            releaser.start()
 
             # Open the named pipes for reading
             with open(stdout_pipe, 'r') as stdout_file, open(stderr_pipe, 'r') as stderr_file:
+                opened.set()
                 # Read stdout and stderr in parallel
                 stdout = stdout_file.read().strip()
                 stderr = stderr_file.read().strip()
 
             # Wait for the tmux popup to complete
             tmux_process.wait()
+            stop.set()
+            releaser.join()
+            # The writer may be blocked waiting for the next batch of choices;
+            # being a daemon thread, it is not waited for any longer
+            writer.join(timeout=WRITER_JOIN_TIMEOUT)
+            if writer.is_alive():
+                logging.debug("the writer of the choices is still waiting for a batch")
 
             # Handle errors or user cancellation
             if tmux_process.returncode == 0:
                 return stdout
+            elif tmux_process.returncode == 1:
+                # No match, e.g. when the input was empty and fzf ran with `-0`
+                return ""
             elif tmux_process.returncode == 130:
                 raise FzfUserInterrupt("User canceled selection.")
             else:
@@ -186,4 +272,5 @@ def run_fzf(fzf_display_options: str, choices: list[str], use_ls_colors: bool) -
 
         finally:
             # Named pipes are automatically cleaned up with the TemporaryDirectory
-            pass
+            stop.set()
+            opened.set()
@@ -0,0 +1,50 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+import re
+from .opener import PreHandledMatch, SchemeEntry
+
+class ItemStore:
+    """Links offered to the user, stored field by field in parallel lists.
+
+    Only what is needed once the pre_handler has run is kept: the text
+    displayed and the tag, the match handed to the post_handler, its position
+    in the captured text, the id of its pane and its scheme. With tens of
+    thousands of links, this takes far less memory than a tuple and the
+    dictionary returned by the pre_handler for every link.
+    """
+
+    __slots__ = ("display_texts", "tags", "matches", "positions", "pane_ids", "schemes")
+
+    def __init__(self):
+        self.display_texts:list[str] = []
+        self.tags:list[str] = []
+        self.matches:list[re.Match[str]] = []
+        self.positions:list[int] = []
+        self.pane_ids:list[str] = []
+        self.schemes:list[SchemeEntry] = []
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def append(self, pre_handled_match:PreHandledMatch, match:re.Match[str], position:int, pane_id:str, scheme:SchemeEntry) -> None:
+        self.display_texts.append(pre_handled_match["display_text"])
+        self.tags.append(pre_handled_match["tag"])
+        self.matches.append(match)
+        self.positions.append(position)
+        self.pane_ids.append(pane_id)
+        self.schemes.append(scheme)
+
+    def extend(self, other:'ItemStore') -> None:
+        for name in self.__slots__:
+            getattr(self, name).extend(getattr(other, name))
+
+    def sort_by_position(self, reverse:bool=False) -> None:
+        """Sort the links by their position; links at the same position keep their order."""
+        order = sorted(range(len(self.positions)), key=self.positions.__getitem__, reverse=reverse)
+        for name in self.__slots__:
+            column = getattr(self, name)
+            setattr(self, name, [column[index] for index in order])
+
+__all__ = ["ItemStore"]
@@ -2,17 +2,22 @@
 #   Author: (c) 2024 Andrea Alberti
 #===============================================================================
 
-import shutil
 import logging
 import re
 import os
 import subprocess
+import tempfile
+import time
 from enum import Enum
-from typing import Callable,TypedDict
+from typing import IO, Callable, NotRequired, TypedDict
 import shlex
 
 from .errors_types import CommandFailed, NoSuitableAppFound
 
+# Time given to each opener to exit; openers still running afterwards (e.g.,
+# a browser staying in the foreground) are left running in the background
+OPENER_TIMEOUT = 2.0
+
 class OpenerType(Enum):
     EDITOR = 0
     BROWSER = 1
@@ -26,6 +31,10 @@ class PreHandledMatch(TypedDict):
 
 PostHandledMatch = dict[str, str] | list[str]
 
+# Opener started by `launch_link`: its arguments, its process, the file
+# collecting its error output and the time at which it was started
+LaunchedOpener = tuple[list[str], subprocess.Popen[bytes], IO[bytes], float]
+
 # Define the structure of each scheme entry
 class SchemeEntry(TypedDict):
     tags: tuple[str,...]
@@ -33,9 +42,11 @@ class SchemeEntry(TypedDict):
     pre_handler: Callable[[re.Match[str]], PreHandledMatch | None] | None  # A function that takes a string and returns a string
     post_handler: Callable[[re.Match[str]], PostHandledMatch] | None  # A function that takes a string and returns a string
     regex: re.Pattern[str]            # A compiled regex pattern
+    literals: NotRequired[tuple[str,...]]  # Strings one of which appears in every match; derived from the regex if missing
+    preview: NotRequired[Callable[[re.Match[str]], str | None]]  # Text shown in the preview window of fzf
 
-def open_link(editor_open_cmd:str, browser_open_cmd:str, post_handled_match:PostHandledMatch, opener:OpenerType):
-    """Open a link using the appropriate handler."""
+def launch_link(editor_open_cmd:str, browser_open_cmd:str, post_handled_match:PostHandledMatch, opener:OpenerType) -> LaunchedOpener:
+    """Start the opener of a link without waiting for it to exit."""
 
     # contains the arguments for subprocess.Popen, including the process to start
     args:list[str]
@@ -48,6 +59,9 @@ def open_link(editor_open_cmd:str, browser_open_cmd:str, post_handled_match:Post
         if isinstance(post_handled_match,list):
             raise RuntimeError("'post_handled_match' is of type 'list' whereas a type 'dict' was expected")     
 
+        # Imported here: only needed to open a link, after fzf has returned
+        import shutil
+
         # template with the command to be executed
         template:str
 
@@ -75,26 +89,51 @@ def open_link(editor_open_cmd:str, browser_open_cmd:str, post_handled_match:Post
         args = shlex.split(cmd)
 
     logging.debug(os.environ["PATH"])
+
+    # The error output goes to an anonymous file rather than a pipe, so that
+    # an opener left running never blocks on it nor fails once we have exited
+    stderr_file = tempfile.TemporaryFile()
     try:
-        # Run the command and capture stdout and stderr
+        # The opener runs in its own session, detached from the tmux job
         proc = subprocess.Popen(
             args,
-            shell=False,  # Execute in the user's default shell
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=False,  # Decode output to strings
+            shell=False,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=stderr_file,
+            start_new_session=True,
         )
-
-        # Communicate to capture output and error
-        _, stderr = proc.communicate()
-
-        # Check for errors or unexpected output
-        if proc.returncode != 0:
-            raise CommandFailed(f"return code {proc.returncode}: {stderr.decode('utf-8')}")
-
-    except FileNotFoundError as e:
+    except FileNotFoundError:
+        stderr_file.close()
         raise CommandFailed(f'could not find "{args[0]}" in the path')
+    except Exception:
+        stderr_file.close()
+        raise CommandFailed(f'failed to execute command "{shlex.join(args)}"')
+
+    return args, proc, stderr_file, time.monotonic()
+
+def wait_for_openers(launched:list[LaunchedOpener], timeout:float=OPENER_TIMEOUT) -> list[str]:
+    """Wait for the openers to exit, each for at most `timeout` seconds since it was started.
+
+    The openers run concurrently, so the total wait is bounded by the slowest
+    of them. Return the errors of those that exited with a nonzero return code.
+    """
+    errors:list[str] = []
+    for args, proc, stderr_file, start_time in launched:
+        with stderr_file:
+            try:
+                returncode = proc.wait(timeout=max(start_time + timeout - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                logging.debug(f'"{args[0]}" still running after {timeout} s; left in the background')
+                continue
+            if returncode != 0:
+                _ = stderr_file.seek(0)
+                stderr = stderr_file.read().decode('utf-8', errors='replace').strip()
+                errors.append(f'"{args[0]}" failed with return code {returncode}' + (f": {stderr}" if stderr else ""))
+    return errors
 
-    except Exception as e:
-        raise CommandFailed(f'failed to execute command "{cmd}"')
-
+def open_link(editor_open_cmd:str, browser_open_cmd:str, post_handled_match:PostHandledMatch, opener:OpenerType):
+    """Open a link using the appropriate handler."""
+    errors = wait_for_openers([launch_link(editor_open_cmd, browser_open_cmd, post_handled_match, opener)])
+    if errors:
+        raise CommandFailed(errors[0])
@@ -0,0 +1,298 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+import os
+import zlib
+import marshal
+import logging
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+
+from .runtime import private_runtime_dir
+from .pathinfo import path_info
+from .tracing import tracer
+
+# Bumped whenever the layout of the cache files changes
+PROJECT_INDEX_VERSION = 1
+# Files marking the root of a project outside of a git repository
+PROJECT_MARKERS = (".hg", ".svn", "pyproject.toml", "setup.py", "package.json", "Cargo.toml", "go.mod")
+# Directories not indexed outside of a git repository
+SKIPPED_DIRS = {".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", ".tox", ".mypy_cache", ".pytest_cache"}
+# Projects with more files than this are not indexed
+MAX_INDEXED_FILES = 1000000
+# Time allowed to `git ls-files`
+GIT_LS_FILES_TIMEOUT = 10.0
+# Number of indexes kept in memory by a resident server
+MAX_CACHED_PROJECTS = 4
+
+class ProjectIndex:
+    """Relative paths of the files of a project, grouped by file name.
+
+    The modification times of the directories holding the files tell whether
+    files were added, removed or renamed since the index was built.
+    """
+
+    __slots__ = ("root", "by_name", "dirs", "mtimes")
+
+    def __init__(self, root:Path, by_name:dict[str,list[str]], dirs:list[str], mtimes:list[int]):
+        self.root = root
+        self.by_name = by_name
+        self.dirs = dirs
+        self.mtimes = mtimes
+
+    def is_valid(self) -> bool:
+        """Return whether no directory of the project changed since the index was built."""
+        root = str(self.root)
+        try:
+            return all(os.stat(os.path.join(root, directory)).st_mtime_ns == mtime for directory, mtime in zip(self.dirs, self.mtimes))
+        except OSError:
+            return False
+
+def find_project_root(directory:Path) -> Path | None:
+    """Return the root of the git repository containing `directory`, or else the closest directory holding a project marker."""
+    marked:Path | None = None
+    for parent in (directory, *directory.parents):
+        if path_info(parent / ".git").exists():
+            marked = parent
+            break
+        if marked is None and any(path_info(parent / marker).exists() for marker in PROJECT_MARKERS):
+            marked = parent
+    # Indexing the whole home directory or file system would never end
+    if marked is None or marked == Path.home() or marked == Path(marked.anchor):
+        return None
+    return marked
+
+def _git_files(root:Path) -> list[str] | None:
+    """Return the files tracked or not ignored by git, relative to the root."""
+    try:
+        result = subprocess.run(["git", "-C", str(root), "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+            capture_output=True, timeout=GIT_LS_FILES_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout.decode(errors="surrogateescape").split("\0")[:-1]
+
+def _walk_files(root:Path) -> list[str]:
+    """Return the files of the project, relative to the root, skipping the usual directories of tools."""
+    files:list[str] = []
+    stack = [""]
+    while stack and len(files) <= MAX_INDEXED_FILES:
+        directory = stack.pop()
+        try:
+            with os.scandir(os.path.join(root, directory)) as entries:
+                for entry in entries:
+                    rel_path = f"{directory}/{entry.name}" if directory else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in SKIPPED_DIRS:
+                            stack.append(rel_path)
+                    else:
+                        files.append(rel_path)
+        except OSError:
+            continue
+    return files
+
+def build_project_index(root:Path) -> ProjectIndex | None:
+    """Index the files of the project; return None when it has too many of them."""
+    files = _git_files(root) if path_info(root / ".git").exists() else None
+    if files is None:
+        files = _walk_files(root)
+    if len(files) > MAX_INDEXED_FILES:
+        logging.debug(f"project {root} has too many files to be indexed")
+        return None
+
+    by_name:dict[str,list[str]] = {}
+    dirs:set[str] = {""}
+    for rel_path in files:
+        directory, _, name = rel_path.rpartition("/")
+        by_name.setdefault(name, []).append(rel_path)
+        dirs.add(directory)
+    sorted_dirs = sorted(dirs)
+    mtimes:list[int] = []
+    for directory in sorted_dirs:
+        try:
+            mtimes.append(os.stat(os.path.join(root, directory)).st_mtime_ns)
+        except OSError:
+            # A directory removed meanwhile never matches, so that the index is rebuilt next time
+            mtimes.append(-1)
+    return ProjectIndex(root, by_name, sorted_dirs, mtimes)
+
+def _index_cache_path(root:Path) -> str:
+    return os.path.join(private_runtime_dir(), f"{zlib.crc32(str(root).encode()):08x}.index")
+
+def _read_index(root:Path) -> ProjectIndex | None:
+    try:
+        # Read at once: `marshal.load` reads a large file in many small pieces
+        with open(_index_cache_path(root), "rb") as f:
+            data = marshal.loads(f.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(data, tuple) or len(data) != 5 or data[:2] != (PROJECT_INDEX_VERSION, str(root)): # pyright: ignore[reportUnknownArgumentType]
+        return None
+    return ProjectIndex(root, data[2], data[3], data[4]) # pyright: ignore[reportUnknownArgumentType]
+
+def _write_index(index:ProjectIndex) -> None:
+    try:
+        path = _index_cache_path(index.root)
+        directory = os.path.dirname(path)
+        # Written to a temporary file first so that a concurrent reader never sees a partial file
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                marshal.dump((PROJECT_INDEX_VERSION, str(index.root), index.by_name, index.dirs, index.mtimes), f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError as e:
+        logging.debug(f"project index could not be written: {e}")
+
+class ProjectIndexCls:
+    """Find the files named by partial paths among the files of the project of the pane.
+
+    Tracebacks and compiler errors often print paths relative to the root of
+    the project, or to a directory of another machine, rather than to the
+    current directory. Each project is indexed once and the index is cached
+    on disk; it is checked once per run against the modification times of
+    the directories and rebuilt when they changed.
+
+    Lookups never wait for an index: it is read, checked and rebuilt on a
+    thread of its own, and the paths looked up meanwhile are searched in the
+    index last loaded, if any. Work done off the critical path, such as the
+    scan of the history, calls `prepare` first to wait for the index.
+    """
+    _instance = None
+
+    enabled:bool
+    _lock:threading.Lock
+    _roots:dict[Path,Path | None]
+    _indexes:dict[Path,ProjectIndex | None]
+    _checked:set[Path]
+    _building:dict[Path,threading.Event]
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.enabled = False
+            cls._instance._lock = threading.Lock()
+            cls._instance._roots = {}
+            cls._instance._indexes = {}
+            cls._instance._checked = set()
+            cls._instance._building = {}
+        return cls._instance
+
+    def clear(self) -> None:
+        """Forget the roots found so far and check the indexes again before they are used."""
+        with self._lock:
+            self._roots.clear()
+            self._checked.clear()
+
+    def _store(self, root:Path, index:ProjectIndex | None) -> None:
+        # Called with the lock held
+        if len(self._indexes) >= MAX_CACHED_PROJECTS and root not in self._indexes:
+            self._indexes.clear()
+        self._indexes[root] = index
+
+    def _refresh(self, root:Path, index:ProjectIndex | None, done:threading.Event) -> None:
+        """Check the index of the project against its directories, reading it from disk first if needed, and rebuild it if they changed."""
+        try:
+            with tracer.stage("project index"):
+                if index is None:
+                    index = _read_index(root)
+                    if index is not None:
+                        # Served, even if out of date, until the check is done
+                        with self._lock:
+                            self._store(root, index)
+                if index is None or not index.is_valid():
+                    # Building takes seconds for large projects
+                    index = build_project_index(root)
+                    if index is not None:
+                        _write_index(index)
+        except Exception as e:
+            logging.debug(f"project {root} could not be indexed: {e}")
+            index = None
+        with self._lock:
+            self._store(root, index)
+            self._checked.add(root)
+            del self._building[root]
+        done.set()
+
+    def _index(self, directory:Path) -> tuple[ProjectIndex | None,threading.Event | None]:
+        """Return the last loaded index of the project of `directory` and, unless it is known to be up to date, the event set once it is."""
+        with self._lock:
+            if directory not in self._roots:
+                self._roots[directory] = find_project_root(directory)
+            root = self._roots[directory]
+            if root is None:
+                return None, None
+            index = self._indexes.get(root)
+            if root in self._checked:
+                return index, None
+            building = self._building.get(root)
+            if building is None:
+                # Reading and checking the index take one stat per directory of the project
+                building = threading.Event()
+                self._building[root] = building
+                threading.Thread(target=self._refresh, args=(root, index, building), daemon=True).start()
+            return index, building
+
+    def prepare(self, directory:Path, wait:bool=True) -> None:
+        """Start bringing the index of the project of `directory` up to date if needed and, unless told otherwise, wait until it is."""
+        _, building = self._index(directory)
+        if building is not None and wait:
+            _ = building.wait()
+
+    def find(self, file_path_str:str, base_dir:Path | None=None) -> Path | None:
+        """Return the file of the project of `base_dir` (by default the current directory) that `file_path_str` refers to.
+
+        A relative path must be a suffix of the path of the file within the
+        project. An absolute path may also come from another root, in which
+        case the file sharing the longest suffix with it is chosen, provided
+        that at least the name of its directory matches too. When several files
+        are equally good candidates, none is chosen.
+        """
+        is_absolute = file_path_str.startswith(("/", "~"))
+        parts = [part for part in file_path_str.split("/") if part not in ("", ".", "~")]
+        # Bare words are not looked up: too many of them would name a file somewhere in the project
+        if not parts or ".." in parts or (len(parts) == 1 and "." not in parts[0] and not is_absolute):
+            return None
+
+        index, _ = self._index(base_dir or Path.cwd())
+        if index is None:
+            return None
+        candidates = index.by_name.get(parts[-1])
+        if not candidates:
+            return None
+
+        best:str | None = None
+        best_matched = 0
+        tied = False
+        for candidate in candidates:
+            candidate_parts = candidate.split("/")
+            num_matched = 1
+            while num_matched < min(len(parts), len(candidate_parts)) \
+                    and parts[-1-num_matched] == candidate_parts[-1-num_matched]:
+                num_matched += 1
+            if num_matched < len(parts) and not is_absolute:
+                continue
+            # A file name alone does not tell an absolute path of another root,
+            # e.g. of an installed package, from a file of the project
+            if is_absolute and num_matched < 2:
+                continue
+            if num_matched > best_matched:
+                best, best_matched, tied = candidate, num_matched, False
+            elif num_matched == best_matched:
+                tied = True
+
+        if best is None or tied:
+            return None
+        file_path = index.root / best
+        return file_path if path_info(file_path).exists() else None
+
+# Instantiate the singleton class
+project_index = ProjectIndexCls()
+
+__all__ = ["ProjectIndex", "build_project_index", "find_project_root", "project_index"]
@@ -0,0 +1,109 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+import os
+import stat
+from pathlib import Path
+
+class PathInfo:
+    """File metadata of a path collected with a single `lstat` (plus one `stat` for symlinks).
+
+    The accessors mirror those of `pathlib.Path` but never touch the file
+    system again.
+    """
+
+    __slots__ = ("path", "lstat", "stat", "_resolved")
+
+    def __init__(self, path:Path):
+        self.path = path
+        self._resolved:Path | None = None
+        try:
+            self.lstat:os.stat_result | None = os.lstat(path)
+        except (OSError, ValueError):
+            self.lstat = None
+
+        if self.lstat is not None and stat.S_ISLNK(self.lstat.st_mode):
+            # Follow the symbolic link to learn about its target
+            try:
+                self.stat:os.stat_result | None = os.stat(path)
+            except (OSError, ValueError):
+                self.stat = None
+        else:
+            self.stat = self.lstat
+
+    def exists(self) -> bool:
+        return self.stat is not None
+
+    def is_symlink(self) -> bool:
+        return self.lstat is not None and stat.S_ISLNK(self.lstat.st_mode)
+
+    def is_dir(self) -> bool:
+        return self.stat is not None and stat.S_ISDIR(self.stat.st_mode)
+
+    def is_file(self) -> bool:
+        return self.stat is not None and stat.S_ISREG(self.stat.st_mode)
+
+    def is_block_device(self) -> bool:
+        return self.stat is not None and stat.S_ISBLK(self.stat.st_mode)
+
+    def is_char_device(self) -> bool:
+        return self.stat is not None and stat.S_ISCHR(self.stat.st_mode)
+
+    def is_fifo(self) -> bool:
+        return self.stat is not None and stat.S_ISFIFO(self.stat.st_mode)
+
+    def is_socket(self) -> bool:
+        return self.stat is not None and stat.S_ISSOCK(self.stat.st_mode)
+
+    def is_executable(self) -> bool:
+        """Return True for a regular file with any execute bit set, the same criterion as `ls`."""
+        return self.is_file() and bool(self.stat.st_mode & 0o111) # pyright: ignore[reportOptionalMemberAccess]
+
+    def resolve(self) -> Path:
+        """Return the absolute path with symlinks resolved, computed only once."""
+        if self._resolved is None:
+            self._resolved = self.path.resolve()
+        return self._resolved
+
+class PathInfoCacheCls:
+    """Cache of `PathInfo` entries shared by path resolution, coloring and opening.
+
+    Entries are keyed by the path string as written, which is relative to the
+    current directory of the pane; the cache must be cleared whenever the
+    current directory changes.
+
+    The links found in other panes than the current one are resolved against
+    the current path of their pane, which is set as `base_dir` meanwhile.
+    """
+    _instance = None
+
+    _entries:dict[str,PathInfo]
+    base_dir:Path | None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._entries = {}
+            cls._instance.base_dir = None
+        return cls._instance
+
+    def get(self, path:Path | str) -> PathInfo:
+        key = str(path)
+        info = self._entries.get(key)
+        if info is None:
+            info = PathInfo(path if isinstance(path, Path) else Path(path))
+            self._entries[key] = info
+        return info
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+# Instantiate the singleton class
+path_info_cache = PathInfoCacheCls()
+
+def path_info(path:Path | str) -> PathInfo:
+    """Return the cached metadata of `path`."""
+    return path_info_cache.get(path)
+
+__all__ = ["PathInfo", "path_info", "path_info_cache"]
@@ -0,0 +1,117 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+import re
+import time
+import bisect
+from collections import deque
+from collections.abc import Iterator
+from typing import TYPE_CHECKING
+from .opener import SchemeEntry, PreHandledMatch
+from .tracing import tracer
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+# Number of pending calls queued per thread; bounds the memory used by futures
+QUEUED_CALLS_PER_THREAD = 64
+
+class ClaimedSpans:
+    """Index of the non-overlapping spans of text already claimed by a scheme.
+
+    Spans are added in batches, one per scheme in order of precedence, so that
+    the matches of the following schemes within a claimed span can be
+    dropped before their pre_handler is called.
+    """
+
+    def __init__(self):
+        self._starts:list[int] = []
+        self._ends:list[int] = []
+
+    def add(self, spans:list[tuple[int,int]]) -> None:
+        """Add spans which overlap neither one another nor the spans already claimed."""
+        if not spans:
+            return
+        merged = sorted([*zip(self._starts, self._ends), *spans])
+        self._starts = [start for start, _ in merged]
+        self._ends = [end for _, end in merged]
+
+    def unclaimed(self, matches:list[re.Match[str]]) -> list[re.Match[str]]:
+        """Return the matches, sorted by position, that do not overlap a claimed span."""
+        if not self._starts:
+            return matches
+        starts = self._starts
+        # Spans do not overlap, so their ends are sorted as well as their starts
+        ends = self._ends
+        num_spans = len(starts)
+        index = 0
+        result:list[re.Match[str]] = []
+        for match in matches:
+            start, end = match.span()
+            while index < num_spans and ends[index] <= start:
+                index += 1
+            if index < num_spans and starts[index] < max(end, start + 1):
+                continue
+            result.append(match)
+        return result
+
+def pre_handle(scheme:SchemeEntry, match:re.Match[str]) -> PreHandledMatch | None:
+    """Apply the pre_handler of the scheme to a match."""
+    if scheme['pre_handler']:
+        return scheme['pre_handler'](match)
+    else:
+        # fallback case when no pre_handler is provided for the scheme
+        return {
+            "display_text": match.group(0),
+            "tag": scheme["tags"][0]
+        }
+
+def _traced_pre_handle(scheme:SchemeEntry, match:re.Match[str]) -> PreHandledMatch | None:
+    start = time.perf_counter()
+    try:
+        return pre_handle(scheme, match)
+    finally:
+        tracer.add_scheme(scheme["tags"][0], pre_handler=time.perf_counter() - start, matches=1)
+
+def pre_handle_matches(
+        schemes:list[SchemeEntry],
+        matches_by_scheme:list[list[re.Match[str]]],
+        num_threads:int=0
+    ) -> Iterator[tuple[SchemeEntry,re.Match[str],PreHandledMatch | None]]:
+    """Pre-handle the matches of every scheme, yielding the results scheme by scheme in order of occurrence.
+
+    With `num_threads` greater than zero, the pre_handlers run concurrently on a
+    bounded thread pool so that the latency of file-system lookups overlaps;
+    the results are still yielded in the same order as in the serial case.
+    """
+    handle = _traced_pre_handle if tracer.enabled else pre_handle
+
+    if num_threads <= 0:
+        for scheme, scheme_matches in zip(schemes, matches_by_scheme):
+            for match in scheme_matches:
+                yield scheme, match, handle(scheme, match)
+        return
+
+    # Imported here: the thread pool is optional and slow to import
+    from concurrent.futures import ThreadPoolExecutor
+
+    max_pending = num_threads * QUEUED_CALLS_PER_THREAD
+    pending:deque[tuple[SchemeEntry,re.Match[str],'Future[PreHandledMatch | None]']] = deque()
+    with ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix="fzf-links") as executor:
+        try:
+            for scheme, scheme_matches in zip(schemes, matches_by_scheme):
+                for match in scheme_matches:
+                    pending.append((scheme, match, executor.submit(handle, scheme, match)))
+                    if len(pending) >= max_pending:
+                        scheme_done, match_done, future = pending.popleft()
+                        yield scheme_done, match_done, future.result()
+            while pending:
+                scheme_done, match_done, future = pending.popleft()
+                yield scheme_done, match_done, future.result()
+        finally:
+            # When the caller stops early, the calls not started yet are dropped
+            for _, _, future in pending:
+                _ = future.cancel()
+
+__all__ = ["ClaimedSpans", "pre_handle", "pre_handle_matches"]
@@ -0,0 +1,201 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Previews shown by fzf next to the links. fzf runs its preview command on
+# every cursor move; the command only prints a file rendered beforehand by
+# the process running fzf, or else asks that process for it over a Unix
+# socket. This module is also run as that client and must stay light: it
+# only depends on modules that are built into the interpreter.
+
+import os
+import sys
+import shlex
+import socket
+import shutil
+import logging
+import tempfile
+import threading
+from collections.abc import Callable
+from pathlib import Path
+
+# Number of lines of a file, or of entries of a directory, shown in a preview
+PREVIEW_MAX_LINES = 200
+# Number of bytes read from the head of a file
+PREVIEW_MAX_BYTES = 32768
+# Number of lines shown before and after the line reported by an error message
+PREVIEW_CONTEXT_LINES = 10
+# Number of items, from the top of the list, whose previews are rendered before they are requested
+PREVIEW_PREFETCH_ITEMS = 100
+# Interval at which the server checks whether it was closed or new items arrived
+PREVIEW_POLL_INTERVAL = 0.1
+# Time the client waits for a preview rendered on request
+PREVIEW_CLIENT_TIMEOUT = 5.0
+
+def file_head(path:Path) -> str:
+    """Return the first lines of a text file, or a short description of a binary one."""
+    with open(path, "rb") as f:
+        chunk = f.read(PREVIEW_MAX_BYTES)
+    if b"\0" in chunk:
+        return f"binary file, {os.stat(path).st_size} bytes"
+    lines = chunk.decode(errors="replace").splitlines()
+    return "\n".join(lines[:PREVIEW_MAX_LINES])
+
+def dir_listing(path:Path) -> str:
+    """Return the entries of a directory, with a slash after the subdirectories."""
+    with os.scandir(path) as entries:
+        names = sorted(f"{entry.name}/" if entry.is_dir() else entry.name for entry in entries)
+    if len(names) > PREVIEW_MAX_LINES:
+        names[PREVIEW_MAX_LINES:] = [f"... {len(names) - PREVIEW_MAX_LINES} more"]
+    return "\n".join(names)
+
+def source_excerpt(path:Path, line:int) -> str:
+    """Return the numbered lines of a file around `line`, which is marked."""
+    first = max(line - PREVIEW_CONTEXT_LINES, 1)
+    last = line + PREVIEW_CONTEXT_LINES
+    width = len(str(last))
+    excerpt:list[str] = []
+    with open(path, errors="replace") as f:
+        for number, text in enumerate(f, 1):
+            if number > last:
+                break
+            if number >= first:
+                marker = ">" if number == line else " "
+                excerpt.append(f"{marker}{number:>{width}} {text.rstrip('\n')}")
+    return "\n".join(excerpt)
+
+class PreviewServer:
+    """Render the previews of the items listed by fzf while it is running.
+
+    Items are identified by their number, the hidden first field of each
+    choice. Each preview is rendered once and written to a file named after
+    the number, which the preview command prints; the first items are
+    rendered ahead, so that moving through them never waits for a slow file
+    system. A preview not rendered yet is requested over a Unix socket in the
+    same directory and rendered on the spot.
+    """
+
+    def __init__(self, render:Callable[[int],str | None], num_items:Callable[[],int]):
+        # `render` returns the preview of the item with the given number, and
+        # `num_items` the number of items listed so far
+        self._render = render
+        self._num_items = num_items
+        self._lock = threading.Lock()
+        self._rendered:set[int] = set()
+        self._closed = threading.Event()
+        self._threads:list[threading.Thread] = []
+        self.directory = tempfile.mkdtemp(prefix="fzf-links-preview-")
+        self.socket_path = os.path.join(self.directory, "preview.sock")
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    def command(self) -> str:
+        """Return the preview command to be given to fzf."""
+        # The package is found where this process found it, e.g. in the zip archive
+        package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return (f"cat {shlex.quote(self.directory)}/{{1}} 2>/dev/null || "
+            f"PYTHONPATH={shlex.quote(package_parent)} {shlex.quote(sys.executable)} -m tmux_fzf_links.preview "
+            f"{shlex.quote(self.socket_path)} {{1}}")
+
+    def start(self) -> None:
+        self._server.bind(self.socket_path)
+        self._server.listen()
+        self._server.settimeout(PREVIEW_POLL_INTERVAL)
+        for target in (self._serve, self._prefetch):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def close(self) -> None:
+        """Stop answering requests and remove the rendered previews."""
+        self._closed.set()
+        for thread in self._threads:
+            thread.join()
+        self._server.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _preview(self, idx:int) -> str:
+        """Return the preview of an item, rendering it and writing its file the first time."""
+        path = os.path.join(self.directory, str(idx))
+        with self._lock:
+            rendered = idx in self._rendered
+        if rendered:
+            with open(path) as f:
+                return f.read()
+
+        try:
+            text = self._render(idx) or ""
+        except Exception as e:
+            text = f"no preview: {e}"
+
+        with self._lock:
+            if idx not in self._rendered:
+                # Written to a temporary file first so that the preview command never prints a partial file
+                tmp_path = f"{path}.tmp{threading.get_ident()}"
+                with open(tmp_path, "w") as f:
+                    _ = f.write(text)
+                os.replace(tmp_path, path)
+                self._rendered.add(idx)
+        return text
+
+    def _serve(self) -> None:
+        while not self._closed.is_set():
+            try:
+                connection, _ = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            with connection:
+                try:
+                    connection.settimeout(PREVIEW_CLIENT_TIMEOUT)
+                    request = connection.makefile().readline().strip()
+                    idx = int(request) if request.isdigit() else 0
+                    text = self._preview(idx) if 0 < idx <= self._num_items() else ""
+                    connection.sendall(text.encode(errors="replace"))
+                except OSError as e:
+                    logging.debug(f"preview request failed: {e}")
+
+    def _prefetch(self) -> None:
+        idx = 1
+        while idx <= PREVIEW_PREFETCH_ITEMS and not self._closed.is_set():
+            if idx > self._num_items():
+                # The history is still being scanned
+                _ = self._closed.wait(PREVIEW_POLL_INTERVAL)
+                continue
+            try:
+                _ = self._preview(idx)
+            except OSError as e:
+                logging.debug(f"preview could not be written: {e}")
+                return
+            idx += 1
+
+def request_preview(socket_path:str, idx:str) -> str:
+    """Ask the process running fzf for the preview of an item."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(PREVIEW_CLIENT_TIMEOUT)
+        client.connect(socket_path)
+        client.sendall(f"{idx}\n".encode())
+        client.shutdown(socket.SHUT_WR)
+
+        chunks:list[bytes] = []
+        while chunk := client.recv(65536):
+            chunks.append(chunk)
+    return b"".join(chunks).decode(errors="replace")
+
+def main(args:list[str] | None=None) -> int:
+    """Print the preview of an item; called by fzf as `preview <socket path> <item number>`."""
+    if args is None:
+        args = sys.argv[1:]
+    if len(args) != 2:
+        print(f"usage: {sys.executable} -m tmux_fzf_links.preview <socket path> <item number>", file=sys.stderr)
+        return 2
+    try:
+        _ = sys.stdout.write(request_preview(args[0], args[1]))
+    except OSError as e:
+        print(f"no preview: {e}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+__all__ = ["PreviewServer", "dir_listing", "file_head", "source_excerpt"]
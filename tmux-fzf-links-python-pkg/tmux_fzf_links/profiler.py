@@ -0,0 +1,104 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+import re
+import time
+
+from .opener import SchemeEntry
+from .prehandler import pre_handle
+from .schemes import compiled_pattern
+
+# Number of characters of the worst line and of the slowest text printed
+PROFILE_EXCERPT_WIDTH = 60
+
+class SchemeProfile:
+    """Cost of a scheme on a captured text, measured independently of the other schemes."""
+
+    __slots__ = ("tag", "num_matches", "num_texts", "num_accepted", "num_errors",
+        "regex_time", "handler_time", "worst_line", "worst_line_time", "worst_text", "worst_text_time")
+
+    def __init__(self, tag:str):
+        self.tag = tag
+        self.num_matches = 0
+        # Distinct texts matched, which are pre-handled once each
+        self.num_texts = 0
+        self.num_accepted = 0
+        self.num_errors = 0
+        self.regex_time = 0.0
+        self.handler_time = 0.0
+        self.worst_line = -1
+        self.worst_line_time = 0.0
+        self.worst_text = ""
+        self.worst_text_time = 0.0
+
+def profile_scheme(scheme:SchemeEntry, content:str, lines:list[tuple[int,int]]) -> SchemeProfile:
+    """Time the regex of the scheme over the whole text and line by line, then its pre_handler on every distinct text."""
+    profile = SchemeProfile(scheme["tags"][0])
+    regex = compiled_pattern(scheme["regex"])
+
+    start = time.perf_counter()
+    matches = list(regex.finditer(content))
+    profile.regex_time = time.perf_counter() - start
+    profile.num_matches = len(matches)
+
+    # The regex is run on each line on its own to find where it is slowest
+    for number, (line_start, line_end) in enumerate(lines, 1):
+        start = time.perf_counter()
+        for _ in regex.finditer(content, line_start, line_end):
+            pass
+        elapsed = time.perf_counter() - start
+        if elapsed > profile.worst_line_time:
+            profile.worst_line, profile.worst_line_time = number, elapsed
+
+    # As in a run, each text is pre-handled once, at its most recent occurrence
+    latest:dict[str,re.Match[str]] = {}
+    for match in matches:
+        latest[match.group(0)] = match
+    profile.num_texts = len(latest)
+    for text, match in latest.items():
+        start = time.perf_counter()
+        try:
+            accepted = pre_handle(scheme, match) is not None
+        except Exception:
+            accepted = False
+            profile.num_errors += 1
+        elapsed = time.perf_counter() - start
+        profile.handler_time += elapsed
+        profile.num_accepted += accepted
+        if elapsed > profile.worst_text_time:
+            profile.worst_text, profile.worst_text_time = text, elapsed
+    return profile
+
+def _excerpt(text:str) -> str:
+    text = text.replace('\t', ' ')
+    return text if len(text) <= PROFILE_EXCERPT_WIDTH else f"{text[:PROFILE_EXCERPT_WIDTH - 1]}…"
+
+def print_profile(schemes:list[SchemeEntry], content:str) -> int:
+    """Print what each scheme costs on the text, most expensive first, followed by its worst line and slowest text."""
+    lines:list[tuple[int,int]] = []
+    line_start = 0
+    for line in content.split('\n'):
+        lines.append((line_start, line_start + len(line)))
+        line_start += len(line) + 1
+
+    profiles = sorted((profile_scheme(scheme, content, lines) for scheme in schemes),
+        key=lambda profile: profile.regex_time + profile.handler_time, reverse=True)
+
+    width = max([len("scheme"), *(len(profile.tag) for profile in profiles)])
+    print(f"{'scheme':<{width}} {'matches':>8} {'texts':>7} {'accepted':>8} {'errors':>6} {'regex ms':>9} {'handler ms':>10} {'line ms':>8}")
+    for profile in profiles:
+        print(f"{profile.tag:<{width}} {profile.num_matches:>8} {profile.num_texts:>7} {profile.num_accepted:>8} {profile.num_errors:>6} "
+            f"{profile.regex_time * 1000:>9.1f} {profile.handler_time * 1000:>10.1f} {profile.worst_line_time * 1000:>8.2f}")
+
+    print()
+    print(f"{'scheme':<{width}} worst line / slowest text")
+    for profile in profiles:
+        if profile.worst_line > 0:
+            line_start, line_end = lines[profile.worst_line - 1]
+            print(f"{profile.tag:<{width}} line {profile.worst_line}: {_excerpt(content[line_start:line_end])}")
+        if profile.worst_text:
+            print(f"{'':<{width}} text ({profile.worst_text_time * 1000:.2f} ms): {_excerpt(profile.worst_text)}")
+    return 0
+
+__all__ = ["SchemeProfile", "profile_scheme", "print_profile"]
@@ -0,0 +1,40 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Private runtime directory holding the sockets and caches of the plugin.
+# Imported by the client and by most modules on the critical path: it only
+# depends on light modules that are built into the interpreter.
+
+import os
+import stat
+import zlib
+
+def runtime_dir() -> str:
+    """Return the private directory holding the sockets and caches of the plugin."""
+    base_dir = os.environ.get("TMUX_TMPDIR", "/tmp")
+    return os.path.join(base_dir, f"tmux-fzf-links-{os.getuid()}")
+
+def ensure_private_dir(path:str) -> str:
+    """Create the directory if needed and return it, or raise PermissionError unless only the current user can use it.
+
+    As tmux does for its socket directory, a directory created beforehand by
+    another user, or a symlink, is refused: whoever controls it could plant the
+    socket of the server or the caches read by the plugin.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) != 0o700:
+        raise PermissionError(f"{path} is not a directory private to the current user")
+    return path
+
+def private_runtime_dir() -> str:
+    """Return the runtime directory once it is known to be private; see `ensure_private_dir`."""
+    return ensure_private_dir(runtime_dir())
+
+def tmux_server_id() -> str:
+    """Return a short identifier of the current tmux server, derived from the path of its socket."""
+    tmux_socket = os.environ.get("TMUX", "").split(",")[0]
+    return f"{zlib.crc32(tmux_socket.encode()):08x}"
+
+__all__ = ["ensure_private_dir", "private_runtime_dir", "runtime_dir", "tmux_server_id"]
@@ -0,0 +1,236 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+import os
+import re
+import time
+import marshal
+import logging
+import tempfile
+from collections.abc import Callable
+from typing import Any
+
+from .budgets import SchemeBudgets
+from .runtime import ensure_private_dir, runtime_dir, tmux_server_id
+from .escapes import Hyperlink
+from .scanner import Scanner
+from .schemes import compiled_pattern
+
+# Bumped whenever the layout of the cache files changes
+CACHE_FORMAT_VERSION = 2
+# Number of history lines captured again to check that the cached history is still in place
+OVERLAP_LINES = 4
+# Cache files of panes not used for this long are removed
+CACHE_MAX_AGE = 24 * 3600.0
+# Number of cache files kept in memory by a resident server
+MAX_CACHED_PANES = 8
+
+# Contents of the cache files already read or written by this process, keyed
+# by path and stored with the modification time of the file
+_memory_cache:dict[str,tuple[int,dict[str,Any]]] = {}
+
+def cache_path(pane_id:str) -> str:
+    """Return the path of the cache file of the pane in the current tmux server."""
+    return os.path.join(runtime_dir(), f"{tmux_server_id()}-{pane_id.lstrip('%')}.scan")
+
+def _read(path:str) -> dict[str,Any]:
+    try:
+        _ = ensure_private_dir(os.path.dirname(path))
+        mtime = os.stat(path).st_mtime_ns
+        cached = _memory_cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(path, "rb") as f:
+            data = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError) as e:
+        if not isinstance(e, FileNotFoundError):
+            logging.debug(f"scan cache could not be read: {e}")
+        return {}
+    if not isinstance(data, dict) or data.get("version") != CACHE_FORMAT_VERSION:
+        return {}
+    return data # pyright: ignore[reportUnknownVariableType]
+
+def _write(path:str, data:dict[str,Any]) -> None:
+    directory = os.path.dirname(path)
+    _ = ensure_private_dir(directory)
+    # Written to a temporary file first so that a concurrent reader never sees a partial file
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            marshal.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    if len(_memory_cache) >= MAX_CACHED_PANES:
+        _memory_cache.clear()
+    _memory_cache[path] = (os.stat(path).st_mtime_ns, data)
+
+    # Remove the cache files of panes that have not been used for a long time
+    expiry = time.time() - CACHE_MAX_AGE
+    for entry in os.scandir(directory):
+        if entry.name.endswith(".scan") and entry.stat().st_mtime < expiry:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+
+def _tail_lines(text:str, num_lines:int) -> list[str]:
+    """Return the last `num_lines` lines of a text in which every line ends with a newline."""
+    pieces = text.rsplit('\n', num_lines + 1)
+    return pieces[1:-1] if len(pieces) == num_lines + 2 else pieces[:-1]
+
+def _align(cached_tail:list[str], new_lines:list[str]) -> int | None:
+    """Return how many leading lines of `new_lines` are the last lines of the cached history, or None if they are not.
+
+    Every line of `cached_tail` must be found again. The first captured line
+    may be the end of a wrapped line, which is joined to its beginning in the
+    cached history; a line wrapped further down makes the lines differ, and
+    the history is scanned again. Blank lines would match any history, so
+    they never prove that the cached history is still in place.
+    """
+    overlap = len(cached_tail)
+    if not overlap or len(new_lines) < overlap or not any(new_lines[:overlap]):
+        return None
+    first, cached_first = new_lines[0], cached_tail[0]
+    if new_lines[1:overlap] != cached_tail[1:] \
+            or (first != cached_first and not (first and cached_first.endswith(first))):
+        return None
+    return overlap
+
+def _rematch(scanner:Scanner, text:str, starts_by_scheme:list[list[int]], shift:int=0) -> list[list[re.Match[str]]]:
+    """Recreate the cached matches, found at the given positions, in `text`."""
+    matches_by_scheme:list[list[re.Match[str]]] = []
+    for scheme, starts in zip(scanner.schemes, starts_by_scheme):
+        regex = compiled_pattern(scheme["regex"])
+        matches:list[re.Match[str]] = []
+        for start in starts:
+            if start >= shift:
+                match = regex.match(text, start - shift)
+                if match is not None:
+                    matches.append(match)
+        matches_by_scheme.append(matches)
+    return matches_by_scheme
+
+def _starts(matches_by_scheme:list[list[re.Match[str]]]) -> list[list[int]]:
+    return [[match.start() for match in matches] for matches in matches_by_scheme]
+
+class PaneScanCache:
+    """Matches found in a pane by the previous call, reused when the pane has not changed.
+
+    Only the history lines added since the previous call are captured and
+    scanned. The cache is discarded when the schemes, the number of history
+    lines or the capture of the `hyperlinks` change, and the cached history
+    when it is cleared (e.g., with `clear-history`) or can no longer be
+    matched with the new lines. Without a `path`, nothing is cached and every
+    call scans the whole content.
+    Matches are not cached once a scheme ran out of its time `budgets`, since
+    some of them may be missing.
+    """
+
+    def __init__(self, scanner:Scanner, path:str | None=None, history_lines:int=0, num_processes:int=0, budgets:SchemeBudgets | None=None, hyperlinks:bool=False):
+        self.scanner = scanner
+        self.path = path
+        self.history_lines = history_lines
+        # Number of processes sharing the scan of a long history
+        self.num_processes = num_processes
+        self.budgets = budgets
+        patterns = [[scheme["regex"].pattern, scheme["regex"].flags] for scheme in scanner.schemes]
+
+        self._data:dict[str,Any] = {}
+        if path is not None:
+            cached = _read(path)
+            if cached.get("patterns") == patterns and cached.get("history_lines") == history_lines \
+                    and cached.get("hyperlinks") == hyperlinks:
+                self._data = dict(cached)
+        self._data.update({
+            "version": CACHE_FORMAT_VERSION,
+            "patterns": patterns,
+            "history_lines": history_lines,
+            "hyperlinks": hyperlinks,
+        })
+
+    def screen(self, content:str) -> list[list[re.Match[str]]]:
+        """Return the matches of the schemes in the visible screen."""
+        cached = self._data.get("screen")
+        if cached is not None and cached[0] == content:
+            return _rematch(self.scanner, content, cached[1])
+
+        matches_by_scheme = self.scanner.scan(content, budgets=self.budgets)
+        self._data["screen"] = (content, _starts(matches_by_scheme))
+        return matches_by_scheme
+
+    def history(
+            self,
+            history_size:int,
+            history_limit:int,
+            capture:Callable[[int],tuple[str,list[Hyperlink]]]
+        ) -> tuple[str,list[list[re.Match[str]]],list[Hyperlink]]:
+        """Return the text of the last `history_lines` lines of the history, with the matches of the schemes and the hyperlinks it contains.
+
+        `capture(n)` must return the plain text of the last `n` lines of the
+        history and the hyperlinks it contains.
+        """
+        cached = self._data.get("history")
+        text:str | None = None
+        start = 0
+        shift = 0
+        cached_starts:list[list[int]] = []
+        hyperlinks:list[Hyperlink] = []
+
+        # The position of the cached lines is known as long as the history has
+        # only grown; once it is full, the oldest lines are silently dropped
+        if cached is not None and history_size < history_limit:
+            cached_size, cached_text, cached_starts, cached_hyperlinks = cached
+            num_added = history_size - cached_size
+            if 0 <= num_added < self.history_lines:
+                new_text, new_hyperlinks = capture(num_added + OVERLAP_LINES)
+                new_lines = new_text.split('\n')[:-1]
+                overlap = _align(_tail_lines(cached_text, OVERLAP_LINES), new_lines) if cached_text else 0
+                if overlap is not None:
+                    joined:str = cached_text + ''.join(f"{line}\n" for line in new_lines[overlap:])
+                    start = len(cached_text)
+                    # Move the hyperlinks of the added lines after the cached text
+                    offset = sum(len(line) + 1 for line in new_lines[:overlap]) - start
+                    hyperlinks = list(cached_hyperlinks) + [
+                        (link_start - offset, link_end - offset, target)
+                        for link_start, link_end, target in new_hyperlinks if link_start - offset >= start
+                    ]
+                    # Drop the lines that moved out of the requested range
+                    num_excess = joined.count('\n') - self.history_lines
+                    if num_excess > 0:
+                        shift = len(joined) - len(joined.split('\n', num_excess)[-1])
+                        joined = joined[shift:]
+                        start = max(start - shift, 0)
+                        hyperlinks = [
+                            (link_start - shift, link_end - shift, target)
+                            for link_start, link_end, target in hyperlinks if link_start >= shift
+                        ]
+                    text = joined
+
+        if text is None:
+            text, hyperlinks = capture(self.history_lines)
+            matches_by_scheme = self.scanner.scan(text, 0, self.num_processes, self.budgets)
+        else:
+            old_matches = _rematch(self.scanner, text, cached_starts, shift)
+            new_matches = self.scanner.scan(text, start, self.num_processes, self.budgets)
+            matches_by_scheme = [
+                [match for match in old if match.start() < start] + new
+                for old, new in zip(old_matches, new_matches)
+            ]
+
+        self._data["history"] = (history_size, text, _starts(matches_by_scheme), hyperlinks)
+        return text, matches_by_scheme, hyperlinks
+
+    def save(self) -> None:
+        """Store the matches for the next call."""
+        if self.path is None or (self.budgets is not None and self.budgets.exceeded):
+            return
+        try:
+            _write(self.path, self._data)
+        except OSError as e:
+            logging.debug(f"scan cache could not be written: {e}")
+
+__all__ = ["PaneScanCache", "cache_path"]
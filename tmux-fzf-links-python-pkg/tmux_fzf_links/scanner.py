@@ -0,0 +1,395 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+import re
+import math
+import time
+import logging
+from collections.abc import Iterator
+from typing import TYPE_CHECKING, Any, cast
+from .budgets import SchemeBudgets
+from .opener import OpenerType, SchemeEntry
+from .schemes import compiled_pattern
+from .tracing import tracer
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from re import _constants, _parser # pyright: ignore[reportAttributeAccessIssue]
+
+    # Character categories which include the newline
+    _NEWLINE_CATEGORIES = {
+        _constants.CATEGORY_SPACE,
+        _constants.CATEGORY_NOT_DIGIT,
+        _constants.CATEGORY_NOT_WORD,
+        _constants.CATEGORY_LINEBREAK,
+        _constants.CATEGORY_UNI_SPACE,
+        _constants.CATEGORY_UNI_NOT_DIGIT,
+        _constants.CATEGORY_UNI_NOT_WORD,
+        _constants.CATEGORY_UNI_LINEBREAK,
+        _constants.CATEGORY_LOC_NOT_WORD,
+    }
+
+    # Anchors which do not match at the end of a line as at the end of the text
+    _MULTILINE_ANCHORS = {
+        _constants.AT_BEGINNING_STRING,
+        _constants.AT_END,
+        _constants.AT_END_STRING,
+    }
+except (ImportError, AttributeError):
+    # Private modules of `re`, renamed before (Python 3.11); without them the
+    # patterns cannot be analyzed, and the text is not prefiltered
+    _constants = _parser = cast(Any, None)
+    _NEWLINE_CATEGORIES = set()
+    _MULTILINE_ANCHORS = set()
+
+# Texts shorter than this are not worth the start-up of the process pool
+PARALLEL_SCAN_MIN_CHARS = 1 << 20
+
+# Number of matches collected by `finditer` between two checks of the time budget
+_BUDGET_CHECK_INTERVAL = 64
+
+def _class_has_newline(items) -> bool: # pyright: ignore[reportMissingParameterType]
+    negate = bool(items) and items[0][0] is _constants.NEGATE
+    found = False
+    for op, av in items[negate:]:
+        if (op is _constants.LITERAL and av == 10) \
+                or (op is _constants.RANGE and av[0] <= 10 <= av[1]) \
+                or (op is _constants.CATEGORY and av in _NEWLINE_CATEGORIES) \
+                or op not in (_constants.LITERAL, _constants.RANGE, _constants.CATEGORY):
+            found = True
+            break
+    return found != negate
+
+def _may_cross_lines(items, dotall:bool) -> bool: # pyright: ignore[reportMissingParameterType]
+    """Return whether a parsed (sub)pattern may match or look at a newline, or depend on the end of the text.
+
+    When unsure, e.g. for a back-reference, return True.
+    """
+    for op, av in items:
+        if op is _constants.LITERAL:
+            if av == 10:
+                return True
+        elif op is _constants.NOT_LITERAL:
+            if av != 10:
+                return True
+        elif op is _constants.ANY:
+            if dotall:
+                return True
+        elif op is _constants.IN:
+            if _class_has_newline(av):
+                return True
+        elif op is _constants.AT:
+            if av in _MULTILINE_ANCHORS:
+                return True
+        elif op is _constants.SUBPATTERN:
+            _, add_flags, del_flags, subpattern = av
+            if _may_cross_lines(subpattern, (dotall or bool(add_flags & re.DOTALL)) and not del_flags & re.DOTALL):
+                return True
+        elif op in (_constants.MAX_REPEAT, _constants.MIN_REPEAT, _constants.POSSESSIVE_REPEAT):
+            if _may_cross_lines(av[2], dotall):
+                return True
+        elif op is _constants.BRANCH:
+            if any(_may_cross_lines(branch, dotall) for branch in av[1]):
+                return True
+        elif op in (_constants.ASSERT, _constants.ASSERT_NOT):
+            if _may_cross_lines(av[1], dotall):
+                return True
+        elif op is _constants.ATOMIC_GROUP:
+            if _may_cross_lines(av, dotall):
+                return True
+        else:
+            return True
+    return False
+
+def _literal_runs(items) -> list[str]: # pyright: ignore[reportMissingParameterType]
+    """Collect the runs of literal characters that every match of a parsed (sub)pattern contains."""
+    runs:list[str] = []
+    run:list[str] = []
+    for op, av in items:
+        if op is _constants.LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            runs.append(''.join(run))
+            run = []
+        if op is _constants.SUBPATTERN:
+            _, add_flags, _, subpattern = av
+            if not add_flags & re.IGNORECASE:
+                runs.extend(_literal_runs(subpattern))
+        elif op is _constants.ATOMIC_GROUP:
+            runs.extend(_literal_runs(av))
+        elif op in (_constants.MAX_REPEAT, _constants.MIN_REPEAT, _constants.POSSESSIVE_REPEAT):
+            if av[0] >= 1:
+                runs.extend(_literal_runs(av[2]))
+    if run:
+        runs.append(''.join(run))
+    return runs
+
+def _prefilter(regex:re.Pattern[str], literals:tuple[str,...] | None) -> tuple[tuple[str,...] | None,bool]:
+    """Return the literals one of which every match of `regex` contains, and whether its matches stay within a line.
+
+    The literals are derived from the pattern when not given; they are None
+    when they cannot be determined.
+    """
+    try:
+        parsed = _parser.parse(regex.pattern, regex.flags)
+    except Exception:
+        return literals or None, False
+    flags = parsed.state.flags
+    if literals is None and not flags & re.IGNORECASE:
+        runs = _literal_runs(parsed.data)
+        if runs:
+            literals = (max(runs, key=len),)
+    if not literals or any(not literal for literal in literals):
+        literals = None
+    single_line = not _may_cross_lines(parsed.data, bool(flags & re.DOTALL)) \
+        and not any('\n' in literal for literal in literals or ())
+    return literals, single_line
+
+def _extend_until(matches:list[re.Match[str]], found:Iterator[re.Match[str]], deadline:float) -> bool:
+    """Append the matches found until the time given by `time.perf_counter()` passes `deadline`; return False if it did."""
+    for count, match in enumerate(found, 1):
+        matches.append(match)
+        if not count % _BUDGET_CHECK_INTERVAL and time.perf_counter() > deadline:
+            return False
+    return True
+
+def _line_regions(content:str, literals:tuple[str,...], start:int) -> list[tuple[int,int]]:
+    """Return the sorted spans, from `start` on, of the runs of lines containing one of the literals."""
+    length = len(content)
+    regions:list[tuple[int,int]] = []
+    for literal in literals:
+        pos = content.find(literal, start)
+        while pos != -1:
+            line_start = content.rfind('\n', start, pos) + 1 or start
+            line_end = content.find('\n', pos + len(literal))
+            if line_end == -1:
+                line_end = length
+            regions.append((line_start, line_end))
+            pos = content.find(literal, line_end)
+    if len(literals) > 1:
+        regions.sort()
+    # Consecutive lines are searched at once
+    merged:list[tuple[int,int]] = []
+    for region in regions:
+        if merged and region[0] <= merged[-1][1] + 1:
+            if region[1] > merged[-1][1]:
+                merged[-1] = (merged[-1][0], region[1])
+        else:
+            merged.append(region)
+    return merged
+
+class Scanner:
+    """Find the matches of all schemes, as running `finditer` for every scheme would.
+
+    Before any regex runs, the text is searched for literal strings that every
+    match of a scheme must contain (declared in `literals` or derived from the
+    pattern). A scheme whose matches stay within a line is only run on the
+    lines containing one of its literals; any other scheme is skipped when
+    none of its literals occurs in the text.
+    """
+
+    def __init__(self, schemes:list[SchemeEntry]):
+        self.schemes = schemes
+        self._regexes = [compiled_pattern(scheme["regex"]) for scheme in schemes]
+        # Literals of the schemes searched line by line, and of the other schemes
+        self._line_literals:dict[int,tuple[str,...]] = {}
+        self._literals:dict[int,tuple[str,...]] = {}
+        # Schemes whose matches stay within a line
+        self._single_line:list[int] = []
+        try:
+            self._analyze()
+        except Exception as e:
+            # The analysis relies on the private parser of `re`, which may
+            # change with the Python version; every scheme is then searched
+            # through the whole text
+            logging.debug(f"patterns not analyzed, scanning without prefilter: {e!r}")
+            self._line_literals.clear()
+            self._literals.clear()
+            self._single_line.clear()
+        # Scanner of the schemes not confined to a line, when the others are scanned in processes
+        self._serial_scanner:Scanner | None = None
+
+    def _analyze(self) -> None:
+        if _parser is None:
+            raise ImportError("re._parser is not available")
+        for index, (scheme, regex) in enumerate(zip(self.schemes, self._regexes)):
+            literals, single_line = _prefilter(regex, scheme.get("literals"))
+            if single_line:
+                self._single_line.append(index)
+            if literals is not None:
+                if single_line:
+                    self._line_literals[index] = literals
+                else:
+                    self._literals[index] = literals
+
+    def scan(self, content:str, start:int=0, num_processes:int=0, budgets:SchemeBudgets | None=None) -> list[list[re.Match[str]]]:
+        """Return the matches of every scheme, grouped by scheme and sorted by position.
+
+        Only matches beginning at or after `start` are returned; the text
+        before it still serves as context, e.g. for look-behind assertions.
+        With `num_processes` greater than one, a long text is split into
+        chunks of whole lines, which are scanned on a process pool by the
+        schemes whose matches stay within a line.
+        With `budgets`, the time spent by the regex of each scheme is charged
+        to it, and a scheme whose budget runs out keeps only the matches
+        found so far.
+        """
+        if num_processes > 1 and self._single_line and len(content) - start >= PARALLEL_SCAN_MIN_CHARS:
+            gathered = self._scan_in_processes(content, start, num_processes)
+            if gathered is not None:
+                return gathered
+
+        results:list[list[re.Match[str]]] = [[] for _ in self._regexes]
+        timed = tracer.enabled or (budgets is not None and bool(budgets.budget))
+        for index, (scheme, regex) in enumerate(zip(self.schemes, self._regexes)):
+            # Time left to the regular expression of the scheme
+            limit = budgets.remaining(scheme) if budgets is not None else math.inf
+            if limit <= 0:
+                continue
+            scan_start = time.perf_counter() if timed else 0.0
+
+            literals = self._line_literals.get(index)
+            if literals is not None:
+                # Schemes confined to lines are run only on the lines containing their literals
+                regions = _line_regions(content, literals, start)
+            elif index in self._literals and all(content.find(literal, start) == -1 for literal in self._literals[index]):
+                # None of the literals occurs, so the scheme cannot match anywhere
+                regions = []
+            else:
+                regions = [(start, len(content))]
+
+            matches = results[index]
+            for region_start, region_end in regions:
+                found = regex.finditer(content, region_start, region_end)
+                if limit == math.inf:
+                    matches.extend(found)
+                elif not _extend_until(matches, found, scan_start + limit) or time.perf_counter() - scan_start > limit:
+                    break
+
+            if timed:
+                seconds = time.perf_counter() - scan_start
+                if budgets is not None:
+                    _ = budgets.charge(scheme, seconds)
+                if tracer.enabled:
+                    tracer.add_scheme(scheme["tags"][0], regex=seconds)
+        return results
+
+    def _scan_in_processes(self, content:str, start:int, num_processes:int) -> list[list[re.Match[str]]] | None:
+        """Scan the text with the help of the process pool; return None if the pool failed, discarding it."""
+        # Imported here: the process pool is optional and slow to import
+        from concurrent.futures.process import BrokenProcessPool
+        try:
+            return self._gather_chunks(content, start, num_processes)
+        except (OSError, BrokenProcessPool) as e:
+            logging.warning(f"process pool failed, scanning in a single process: {e}")
+            _discard_process_pool()
+            return None
+
+    def _gather_chunks(self, content:str, start:int, num_processes:int) -> list[list[re.Match[str]]]:
+        regexes = self._regexes
+        parallel = self._single_line
+        patterns = [(regexes[index].pattern, regexes[index].flags, self.schemes[index].get("literals")) for index in parallel]
+
+        # Each chunk is sent with the newline preceding it, which is all the
+        # context that the patterns confined to a line can look at
+        pool = _get_process_pool(num_processes)
+        futures = [
+            pool.submit(_scan_chunk, patterns, content[context:chunk_end], chunk_start - context, context)
+            for chunk_start, chunk_end in _line_chunks(content, start, num_processes)
+            for context in (max(content.rfind('\n', 0, chunk_start), 0),)
+        ]
+
+        # The other schemes are scanned meanwhile
+        results:list[list[re.Match[str]]] = [[] for _ in regexes]
+        serial = [index for index in range(len(regexes)) if index not in parallel]
+        if serial:
+            if self._serial_scanner is None:
+                self._serial_scanner = Scanner([self.schemes[index] for index in serial])
+            for index, matches in zip(serial, self._serial_scanner.scan(content, start)):
+                results[index] = matches
+
+        # Match objects cannot be sent across processes; they are recreated at
+        # the positions found, where the patterns match exactly as in the chunks
+        with tracer.stage("gather chunks"):
+            for future in futures:
+                for index, starts in zip(parallel, future.result()):
+                    regex = regexes[index]
+                    matches = results[index]
+                    for match_start in starts:
+                        match = regex.match(content, match_start)
+                        if match is not None:
+                            matches.append(match)
+        return results
+
+def _line_chunks(content:str, start:int, num_chunks:int) -> list[tuple[int,int]]:
+    """Split the text from `start` on into about `num_chunks` spans of whole lines."""
+    length = len(content)
+    size = (length - start) // num_chunks + 1
+    chunks:list[tuple[int,int]] = []
+    chunk_start = start
+    while chunk_start < length:
+        chunk_end = content.find('\n', chunk_start + size)
+        chunk_end = length if chunk_end == -1 else chunk_end + 1
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end
+    return chunks
+
+def _scan_chunk(patterns:list[tuple[str,int,tuple[str,...] | None]], text:str, start:int, offset:int) -> list[list[int]]:
+    """Return, for each pattern, the positions of the matches in `text` from `start` on, shifted by `offset`.
+
+    Run in the worker processes of the pool.
+    """
+    schemes:list[SchemeEntry] = []
+    for pattern, flags, literals in patterns:
+        scheme:SchemeEntry = {"tags": (pattern,), "opener": OpenerType.CUSTOM, "pre_handler": None, "post_handler": None, "regex": re.compile(pattern, flags)}
+        if literals is not None:
+            scheme["literals"] = literals
+        schemes.append(scheme)
+    return [
+        [match.start() + offset for match in matches]
+        for matches in get_scanner(schemes).scan(text, start)
+    ]
+
+# Pool of worker processes, kept for the following calls of a resident server
+_process_pool:tuple[int,'ProcessPoolExecutor'] | None = None
+
+def _get_process_pool(num_processes:int) -> 'ProcessPoolExecutor':
+    global _process_pool
+    if _process_pool is None or _process_pool[0] != num_processes:
+        # Imported here: the process pool is optional and slow to import
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        if _process_pool is not None:
+            _process_pool[1].shutdown(wait=False)
+        # Forking a process running several threads is unsafe
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _process_pool = (num_processes, ProcessPoolExecutor(max_workers=num_processes, mp_context=multiprocessing.get_context(method)))
+    return _process_pool[1]
+
+def _discard_process_pool() -> None:
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool[1].shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+# Scanners already built, keyed by the patterns of their schemes
+MAX_CACHED_SCANNERS = 8
+_scanners_cache:dict[tuple[tuple[re.Pattern[str],tuple[str,...] | None],...],Scanner] = {}
+
+def get_scanner(schemes:list[SchemeEntry]) -> Scanner:
+    """Return a scanner for the schemes, reusing the one built for the same patterns."""
+    key = tuple((scheme["regex"], scheme.get("literals")) for scheme in schemes)
+    scanner = _scanners_cache.get(key)
+    if scanner is None:
+        if len(_scanners_cache) >= MAX_CACHED_SCANNERS:
+            # The schemes changed several times (e.g., the user schemes were edited)
+            _scanners_cache.clear()
+        scanner = Scanner(schemes)
+        _scanners_cache[key] = scanner
+    return scanner
+
+__all__ = ["Scanner", "get_scanner"]
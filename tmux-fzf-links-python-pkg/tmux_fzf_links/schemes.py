@@ -2,18 +2,71 @@
 #   Author: (c) 2024 Andrea Alberti
 #===============================================================================
 
+import re
 from os.path import expanduser
 from pathlib import Path
+from typing import Any, cast
+from .pathinfo import path_info, path_info_cache
+from .pathindex import project_index
+
+class LazyPattern:
+    """Stand-in for a compiled regular expression that is compiled on first use.
+
+    The source and the flags are available without compiling, so that schemes
+    which are removed (e.g., through `rm_default_schemes`) never pay for it.
+    """
+    __slots__ = ("pattern", "flags", "_compiled")
+
+    def __init__(self, pattern:str, flags:int=0):
+        self.pattern = pattern
+        self.flags = flags
+        self._compiled:re.Pattern[str] | None = None
+
+    def __getattr__(self, name:str) -> Any:
+        # Only called for the attributes of the compiled pattern
+        if self._compiled is None:
+            self._compiled = re.compile(self.pattern, self.flags)
+        return getattr(self._compiled, name)
+
+    def __hash__(self) -> int:
+        return hash((self.pattern, self.flags))
+
+    def __eq__(self, other:object) -> bool:
+        return isinstance(other, LazyPattern) and (self.pattern, self.flags) == (other.pattern, other.flags)
+
+def lazy_compile(pattern:str, flags:int=0) -> re.Pattern[str]:
+    """Return a regular expression that is compiled only when it is first used."""
+    return cast(re.Pattern[str], LazyPattern(pattern, flags))
+
+def compiled_pattern(regex:re.Pattern[str]) -> re.Pattern[str]:
+    """Return the compiled pattern behind a regex returned by `lazy_compile`.
+
+    Loops calling `match` or `finditer` many times use it directly rather
+    than going through the attribute lookup of `LazyPattern` on every call.
+    """
+    lazy = cast(object, regex)
+    if isinstance(lazy, LazyPattern):
+        if lazy._compiled is None: # pyright: ignore[reportPrivateUsage]
+            lazy._compiled = re.compile(lazy.pattern, lazy.flags) # pyright: ignore[reportPrivateUsage]
+        return lazy._compiled # pyright: ignore[reportPrivateUsage]
+    return regex
 
 def heuristic_find_file(file_path_str:str) -> Path | None:
 
     # Expand tilde (~) to the user's home directory    
     file_path = Path(expanduser(file_path_str))
+    # Paths found in another pane are relative to the current path of that pane
+    if path_info_cache.base_dir is not None:
+        file_path = path_info_cache.base_dir / file_path
     # Check if the file exists either as is or relative to the current directory
-    if file_path.exists():
+    if path_info(file_path).exists():
         return file_path  # Return the absolute path
+    elif project_index.enabled:
+        # Look for the file elsewhere in the project, e.g., when the path is
+        # relative to its root or was printed on another machine
+        return project_index.find(file_path_str, path_info_cache.base_dir)
     else:
         # Drop the match if it corresponds to no file
         return None
 
-__all__ = ["heuristic_find_file"]
\ No newline at end of file
+__all__ = ["compiled_pattern", "heuristic_find_file", "lazy_compile"]
\ No newline at end of file
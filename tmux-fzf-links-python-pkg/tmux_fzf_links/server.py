@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+# Resident server answering the requests of `tmux_fzf_links.client` over a
+# Unix socket. It keeps the package imported, the user schemes loaded, the
+# regular expressions compiled and LS_COLORS parsed across key presses.
+
+import os
+import sys
+import json
+import errno
+import fcntl
+import socket
+import logging
+
+from .__main__ import main as run_main
+from .client import FORWARDED_ENV_VARS, SERVER_READY
+from .runtime import ensure_private_dir
+
+# Interval at which the server checks whether it is still needed
+IDLE_CHECK_INTERVAL = 60.0
+# The server exits after this many seconds without requests
+IDLE_TIMEOUT = 8 * 3600.0
+
+def package_mtimes() -> dict[str,int]:
+    """Return the modification times of the modules of the package."""
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    mtimes:dict[str,int] = {}
+    try:
+        for entry in os.scandir(package_dir):
+            if entry.name.endswith(".py"):
+                mtimes[entry.name] = entry.stat().st_mtime_ns
+    except OSError:
+        # Imported from a zip archive; the archive itself is checked instead
+        archive = package_dir.rsplit(".pyz", 1)[0] + ".pyz"
+        if os.path.isfile(archive):
+            mtimes[archive] = os.stat(archive).st_mtime_ns
+    return mtimes
+
+def tmux_server_alive(env:dict[str,str]) -> bool:
+    """Return whether the tmux server the requests come from is still running."""
+    tmux_socket = env.get("TMUX", "").split(",")[0]
+    return not tmux_socket or os.path.exists(tmux_socket)
+
+def serve_request(connection:socket.socket) -> dict[str,str] | None:
+    """Serve a single request and send back the exit status; return its environment, or None if the client gave up.
+
+    Requests are served one at a time because running the plugin changes the
+    current directory and the environment of the process. A client left
+    waiting while another request is served serves its own request instead.
+    """
+    chunks:list[bytes] = []
+    try:
+        connection.sendall(SERVER_READY)
+        while chunk := connection.recv(65536):
+            chunks.append(chunk)
+    except OSError:
+        chunks = []
+    if not chunks:
+        # The client stopped waiting before the request was taken
+        return None
+    request = json.loads(b"".join(chunks))
+
+    env:dict[str,str] = request.get("env", {})
+    # Target the tmux server and pane the key was pressed in; the variables
+    # missing from the request are unset in its client
+    for name in (*FORWARDED_ENV_VARS, "TMUX_PANE"):
+        os.environ.pop(name, None)
+    os.environ.update(env)
+
+    status = run_main([str(arg) for arg in request.get("args", [])])
+
+    # Release the file handlers so that log files can be rotated between requests
+    for handler in logging.getLogger().handlers[:]:
+        if isinstance(handler, logging.FileHandler):
+            logging.getLogger().removeHandler(handler)
+            handler.close()
+
+    try:
+        connection.sendall(json.dumps({"status": status}).encode())
+    except OSError:
+        # The client went away, e.g. because tmux killed the job
+        pass
+    return env
+
+def serve(path:str) -> None:
+    """Accept requests on the Unix socket at `path` until the server is no longer needed."""
+    _ = ensure_private_dir(os.path.dirname(path))
+
+    # Only one server per socket; a concurrent start gives up here
+    lock_file = open(f"{path}.lock", "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError as e:
+        if e.errno in (errno.EAGAIN, errno.EACCES):
+            return
+        raise
+
+    # Remove the socket left behind by a server that did not exit cleanly
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+    mtimes = package_mtimes()
+    env:dict[str,str] = dict(os.environ)
+    idle_time = 0.0
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(path)
+        server.listen()
+        server.settimeout(IDLE_CHECK_INTERVAL)
+        try:
+            while True:
+                try:
+                    connection, _ = server.accept()
+                except socket.timeout:
+                    idle_time += IDLE_CHECK_INTERVAL
+                    if idle_time >= IDLE_TIMEOUT or not tmux_server_alive(env):
+                        break
+                    continue
+
+                idle_time = 0.0
+                with connection:
+                    connection.settimeout(None)
+                    try:
+                        env = serve_request(connection) or env
+                    except Exception as e:
+                        logging.error(f"unexpected server error: {e}")
+
+                # Make way for a new server when the plugin has been updated
+                if package_mtimes() != mtimes:
+                    break
+        finally:
+            os.unlink(path)
+            lock_file.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(f"usage: {sys.executable} -m tmux_fzf_links.server <socket path>", file=sys.stderr)
+        sys.exit(2)
+    serve(sys.argv[1])
+
+__all__ = []
@@ -0,0 +1,155 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+import subprocess
+from collections.abc import Iterator
+
+# Variables of the current pane fetched at once by every invocation
+PANE_VARIABLES = ("pane_id", "pane_height", "pane_width", "history_size", "history_limit", "pane_current_path")
+
+# Variables of the panes listed by `list_panes`
+LISTED_PANE_VARIABLES = ("pane_id", "window_index", "pane_index", "pane_current_path")
+
+# Options of `capture-pane`: join wrapped lines and print to stdout
+CAPTURE_OPTIONS = ("-J", "-p")
+
+class TmuxCls:
+    """Access layer to the tmux server shared by all modules.
+
+    Every tmux command started by the plugin goes through this class. The
+    variables of the pane and its visible screen are fetched together by a
+    single tmux client, which is started as early as possible and queried
+    only when the results are needed.
+    """
+    _instance = None
+
+    escapes:bool
+    _snapshot:subprocess.Popen[str] | None
+    _pane:dict[str,str] | None
+    _screen:str | None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.escapes = False
+            cls._instance._snapshot = None
+            cls._instance._pane = None
+            cls._instance._screen = None
+        return cls._instance
+
+    def _capture_options(self) -> list[str]:
+        return [*CAPTURE_OPTIONS, '-e'] if self.escapes else list(CAPTURE_OPTIONS)
+
+    def start_snapshot(self, escapes:bool=False) -> None:
+        """Start fetching the variables and the visible screen of the current pane in the background.
+
+        With `escapes`, this and the following captures keep the escape
+        sequences, which carry the OSC 8 hyperlinks; without them, about
+        half as many bytes are read.
+        """
+        self.escapes = escapes
+        self._pane = None
+        self._screen = None
+        # Commands separated by ";" are run by the server in a single round-trip
+        self._snapshot = subprocess.Popen(
+            ['tmux',
+                'display', '-p', '\t'.join(f"#{{{name}}}" for name in PANE_VARIABLES), ';',
+                'capture-pane', *self._capture_options()],
+            shell=False,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+
+    def _wait_snapshot(self) -> None:
+        if self._pane is not None:
+            return
+        if self._snapshot is None:
+            self.start_snapshot()
+        proc = self._snapshot
+        assert proc is not None
+        output, _ = proc.communicate()
+        self._snapshot = None
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+        variables, _, self._screen = output.partition('\n')
+        # The current path comes last because it is the only value that may contain tabs
+        self._pane = dict(zip(PANE_VARIABLES, variables.split('\t', len(PANE_VARIABLES)-1)))
+
+    def pane(self) -> dict[str,str]:
+        """Return the variables of the current pane listed in `PANE_VARIABLES`."""
+        self._wait_snapshot()
+        assert self._pane is not None
+        return self._pane
+
+    def screen(self) -> str:
+        """Return the visible screen of the current pane."""
+        self._wait_snapshot()
+        assert self._screen is not None
+        return self._screen
+
+    def capture(self, start:str | None=None, end:str | None=None) -> str:
+        """Capture the lines of the current pane between `start` and `end` (see `capture-pane -S/-E`)."""
+        args:list[str] = ['tmux', 'capture-pane', *self._capture_options()]
+        if start is not None:
+            args.extend(['-S', start])
+        if end is not None:
+            args.extend(['-E', end])
+        return subprocess.check_output(args, shell=False, text=True)
+
+    def list_panes(self, session:bool=False) -> list[dict[str,str]]:
+        """List the panes of the current window, or of the current session with `session`.
+
+        Each pane is described by the variables listed in `LISTED_PANE_VARIABLES`.
+        """
+        args = ['tmux', 'list-panes', '-F', '\t'.join(f"#{{{name}}}" for name in LISTED_PANE_VARIABLES)]
+        if session:
+            args.append('-s')
+        output = subprocess.check_output(args, shell=False, text=True)
+        # The current path comes last because it is the only value that may contain tabs
+        return [dict(zip(LISTED_PANE_VARIABLES, line.split('\t', len(LISTED_PANE_VARIABLES)-1)))
+            for line in output.splitlines()]
+
+    def capture_panes(self, pane_ids:list[str], start:str | None=None) -> Iterator[tuple[str,str | None]]:
+        """Capture several panes concurrently, from line `start` to the end of their visible screen.
+
+        All captures are started at once, before this method returns; the
+        content of each pane is then yielded in order, or None when the pane
+        could not be captured (e.g., because it was closed in the meantime).
+        """
+        args:list[str] = ['capture-pane', *self._capture_options()]
+        if start is not None:
+            args.extend(['-S', start])
+        procs = [(pane_id, subprocess.Popen(['tmux', *args, '-t', pane_id],
+                shell=False, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True))
+            for pane_id in pane_ids]
+
+        def results() -> Iterator[tuple[str,str | None]]:
+            for pane_id, proc in procs:
+                output, _ = proc.communicate()
+                yield pane_id, output if proc.returncode == 0 else None
+        return results()
+
+    def display_message(self, message:str, persistent:bool=False) -> None:
+        """Show a message in the status line; with `persistent`, until a key is pressed."""
+        args = ['tmux', 'display-message']
+        if persistent:
+            args.extend(['-d', '0'])
+        args.append(message)
+        _ = subprocess.run(
+            args,
+            check=True,
+            shell=False,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def popup(self, popup_options:list[str], command:str) -> subprocess.Popen[bytes]:
+        """Run a shell command in a popup over the current pane."""
+        return subprocess.Popen(['tmux', 'popup', *popup_options, command], shell=False)
+
+# Instantiate the singleton class
+tmux = TmuxCls()
+
+__all__ = ["tmux"]
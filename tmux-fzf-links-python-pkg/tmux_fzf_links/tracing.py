@@ -0,0 +1,179 @@
+#===============================================================================
+#   Author: (c) 2024 Andrea Alberti
+#===============================================================================
+
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from contextlib import AbstractContextManager, nullcontext
+from types import TracebackType
+
+from .runtime import private_runtime_dir, runtime_dir
+
+# Name of the file, in the runtime directory, with the durations of the last runs
+STATS_FILENAME = "stats.json"
+# Bumped whenever the layout of the statistics file changes
+STATS_FORMAT_VERSION = 1
+# Number of runs kept for each stage
+STATS_WINDOW = 500
+# Percentiles printed by the `stats` subcommand
+STATS_PERCENTILES = (50, 95, 99)
+
+# Returned by `stage` while tracing is disabled
+_NULL_CONTEXT = nullcontext()
+
+class _Stage:
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer:"TracerCls", name:str):
+        self.tracer = tracer
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type:type[BaseException] | None, exc:BaseException | None, traceback:TracebackType | None) -> None:
+        self.tracer.add(self.name, time.perf_counter() - self.start)
+
+class TracerCls:
+    """Time spent in each stage of a run and by each scheme.
+
+    Stages running in several threads, or several times, add up. At the end
+    of the run, the trace is written as JSON to the log file and the
+    durations are added to the statistics printed by the `stats` subcommand.
+    While disabled, `stage` returns a shared no-op context manager.
+    """
+    _instance = None
+
+    enabled:bool
+    _start:float
+    _stages:dict[str,float]
+    _schemes:dict[str,dict[str,float]]
+    _lock:threading.Lock
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.enabled = False
+            cls._instance._start = 0.0
+            cls._instance._stages = {}
+            cls._instance._schemes = {}
+            cls._instance._lock = threading.Lock()
+        return cls._instance
+
+    def start(self, enabled:bool) -> None:
+        """Start tracing a new run."""
+        self.enabled = enabled
+        self._start = time.perf_counter()
+        self._stages = {}
+        self._schemes = {}
+
+    def stage(self, name:str) -> AbstractContextManager[None]:
+        """Return a context manager measuring the time spent in the stage `name`."""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return _Stage(self, name)
+
+    def add(self, name:str, seconds:float) -> None:
+        with self._lock:
+            self._stages[name] = self._stages.get(name, 0.0) + seconds
+
+    def add_scheme(self, tag:str, regex:float=0.0, pre_handler:float=0.0, matches:int=0) -> None:
+        """Add the time spent by the regular expression and the pre_handler of a scheme."""
+        with self._lock:
+            entry = self._schemes.setdefault(tag, {"regex": 0.0, "pre_handler": 0.0, "matches": 0})
+            entry["regex"] += regex
+            entry["pre_handler"] += pre_handler
+            entry["matches"] += matches
+
+    def finish(self, status:int=0) -> None:
+        """Write the trace of the run to the log file and update the statistics."""
+        if not self.enabled:
+            return
+        self.enabled = False
+
+        with self._lock:
+            trace = {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "status": status,
+                "total_ms": round((time.perf_counter() - self._start) * 1e3, 3),
+                "stages": {name: round(seconds * 1e3, 3) for name, seconds in self._stages.items()},
+                "schemes": {tag: {
+                        "regex_ms": round(entry["regex"] * 1e3, 3),
+                        "pre_handler_ms": round(entry["pre_handler"] * 1e3, 3),
+                        "matches": int(entry["matches"]),
+                    } for tag, entry in self._schemes.items()},
+            }
+
+        # The trace goes to the log file only, never to the tmux status line
+        record = logging.LogRecord("trace", logging.INFO, __file__, 0, "trace: %s", (json.dumps(trace),), None)
+        for handler in logging.getLogger().handlers:
+            if isinstance(handler, logging.FileHandler):
+                handler.handle(record)
+
+        durations = {"total": trace["total_ms"], **trace["stages"]}
+        for tag, entry in trace["schemes"].items():
+            durations[f"regex[{tag}]"] = entry["regex_ms"]
+            durations[f"pre_handler[{tag}]"] = entry["pre_handler_ms"]
+        try:
+            update_stats(durations)
+        except OSError as e:
+            logging.debug(f"statistics could not be written: {e}")
+
+# Instantiate the singleton class
+tracer = TracerCls()
+
+def stats_path() -> str:
+    return os.path.join(private_runtime_dir(), STATS_FILENAME)
+
+def read_stats() -> dict[str,list[float]]:
+    """Return the durations in milliseconds of the last runs, keyed by stage."""
+    try:
+        with open(stats_path()) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != STATS_FORMAT_VERSION:
+        return {}
+    return data.get("durations", {})
+
+def update_stats(durations:dict[str,float]) -> None:
+    """Add the durations of a run to the statistics, keeping the last `STATS_WINDOW` runs."""
+    stats = read_stats()
+    for name, value in durations.items():
+        stats[name] = (stats.get(name, []) + [value])[-STATS_WINDOW:]
+
+    path = stats_path()
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump({"version": STATS_FORMAT_VERSION, "durations": stats}, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def percentile(values:list[float], percent:float) -> float:
+    """Return the percentile of the values with the nearest-rank method."""
+    ordered = sorted(values)
+    rank = max(int(-(-percent * len(ordered) // 100)), 1)
+    return ordered[rank - 1]
+
+def print_stats() -> int:
+    """Print the percentiles of the duration of each stage over the last runs."""
+    stats = read_stats()
+    if not stats:
+        print(f"no statistics recorded yet in {os.path.join(runtime_dir(), STATS_FILENAME)}; enable them with: set -g @fzf-links-trace on")
+        return 1
+
+    width = max(len(name) for name in stats)
+    print(f"{'stage':<{width}} {'runs':>6} " + ' '.join(f"{f'p{p} ms':>9}" for p in STATS_PERCENTILES))
+    for name, values in stats.items():
+        print(f"{name:<{width}} {len(values):>6} " + ' '.join(f"{percentile(values, p):>9.1f}" for p in STATS_PERCENTILES))
+    return 0
+
+__all__ = ["tracer", "print_stats"]